@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+import argparse
+import random
+import re
+import timeit
+import typing as T
+
+from kug_mapper import data_reader
+
+
+def _parse_ini_regex(content: str) -> T.Dict[str, T.Any]:
+    ret: T.Dict[str, T.Any] = {}
+    lines = content.replace("\r", "").split("\n")
+    for line in lines:
+        match = re.match(r"^\[(.*)\]$", line)
+        if match:
+            (name,) = match.groups()
+            ret[name] = current_obj = {}
+            continue
+
+        match = re.match(r"^([^=]+)=(.*)$", line)
+        if match:
+            key, value = match.groups()
+            current_obj[key] = value
+            continue
+
+    return ret
+
+
+def _make_tiles_chunk(rng: random.Random) -> str:
+    lines = ["[General]"]
+    lines += [
+        "Tileset %d=Tileset %d" % (i, rng.randrange(50)) for i in range(3)
+    ]
+    lines.append("[Tile Map]")
+    for y in range(18):
+        lines.append(
+            "%d=%s"
+            % (
+                y,
+                "".join(
+                    rng.choice(
+                        [
+                            "X00",
+                            "%d%d%d"
+                            % (
+                                rng.randrange(3),
+                                rng.randrange(5),
+                                rng.randrange(5),
+                            ),
+                        ]
+                    )
+                    for _ in range(31)
+                ),
+            )
+        )
+    return "\r\n".join(lines)
+
+
+def _make_entities_chunk(rng: random.Random, kind: str, count: int) -> str:
+    lines = ["[Null %s]" % kind]
+    for i in range(count):
+        lines += [
+            "[%s %d]" % (kind, i),
+            "%s=%s %d" % (kind, kind, rng.randrange(70)),
+            "X=%d" % rng.randrange(992),
+            "Y=%d" % rng.randrange(576),
+            "Angle=%d" % rng.choice([0, 90, 180]),
+            "RGB Coefficient=%d" % rng.randrange(0xFFFFFF),
+        ]
+    return "\r\n".join(lines)
+
+
+def _make_settings_chunk(rng: random.Random) -> str:
+    return "\r\n".join(
+        [
+            "[General]",
+            "Gradient Top=%d" % rng.randrange(0xFFFFFF),
+            "Gradient Bottom=%d" % rng.randrange(0xFFFFFF),
+            "Music=%d" % rng.randrange(100),
+        ]
+    )
+
+
+def make_corpus(rooms: int, seed: int = 0) -> T.List[str]:
+    rng = random.Random(seed)
+    corpus: T.List[str] = []
+    for _ in range(rooms):
+        corpus.append(_make_tiles_chunk(rng))
+        corpus.append(_make_entities_chunk(rng, "Sprite", rng.randrange(10)))
+        corpus.append(_make_entities_chunk(rng, "Object", rng.randrange(30)))
+        corpus.append(_make_settings_chunk(rng))
+    return corpus
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare INI parsers on a synthetic room chunk corpus."
+    )
+    parser.add_argument("--rooms", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.rooms)
+    for content in corpus:
+        assert data_reader._parse_ini(content) == _parse_ini_regex(content)
+
+    candidates = [
+        ("regex", lambda: [_parse_ini_regex(content) for content in corpus]),
+        (
+            "partition",
+            lambda: [data_reader._parse_ini(content) for content in corpus],
+        ),
+    ]
+    print("%d chunks, best of %d runs" % (len(corpus), args.repeat))
+    for name, func in candidates:
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print("%-16s %8.2f ms" % (name, best * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import tempfile
+import time
+import typing as T
+
+from benchmarks import synthetic
+from kug_mapper import data, data_reader, png, render_plan, renderer, util
+
+Stage = T.Tuple[str, T.Callable[[], T.Any]]
+
+
+def _time(func: T.Callable[[], T.Any]) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def _get_stages(
+    game_dir: str, args: argparse.Namespace, output_dir: str
+) -> T.List[Stage]:
+    world_bin_path = os.path.join(game_dir, "World.bin")
+    state: T.Dict[str, T.Any] = {}
+
+    def scan_index() -> None:
+        source = data_reader._open_world_source(world_bin_path, True)
+        state["source"] = source
+        state["chunks"] = [
+            data.Chunk(x, y, name, offset, size)
+            for x, y, name, offset, size in source.iterate()
+        ]
+
+    def extract_warps() -> None:
+        data_reader._scan_warps(state["source"], state["chunks"])
+
+    def parse_ini() -> None:
+        state["source"].load_many(
+            [chunk for chunk in state["chunks"] if chunk.name != "Script"]
+        )
+
+    def read_world() -> None:
+        state["source"].close()
+        state["world"] = data_reader.read_world(game_dir, None)
+        state["sprites"] = data_reader.read_sprites(game_dir)
+        state["geometry"] = renderer.get_world_geometry(state["world"], None)
+        state["world"].preload(
+            [room.pos for room in state["world"]],
+            ("Objects", "Settings", "Sprites", "Tiles"),
+        )
+
+    def compile_plans() -> None:
+        room_renderer = renderer._RoomRenderer(
+            state["world"],
+            state["sprites"],
+            args.backgrounds_opacity,
+            args.objects_opacity,
+            synthetic.WHITELISTED_OBJECTS,
+            args.tiles_opacity,
+            state["geometry"],
+            args.scale,
+        )
+        geometry = state["geometry"]
+        state["room_renderer"] = room_renderer
+        state["plans"] = {
+            room_pos: room_renderer.get_plan(room_pos)
+            for room_pos in util.range2d(
+                geometry.min_x,
+                geometry.min_y,
+                geometry.max_x + 1,
+                geometry.max_y + 1,
+            )
+        }
+        state["images"] = {
+            room_pos: renderer._create_room_image()
+            for room_pos in state["plans"]
+        }
+
+    def render_layer(
+        func: T.Callable[[T.Any, render_plan.RoomPlan], None],
+    ) -> T.Callable[[], None]:
+        def run() -> None:
+            for room_pos, plan in state["plans"].items():
+                func(state["images"][room_pos], plan)
+
+        return run
+
+    def render_objects(
+        opacity: float,
+        whitelist: T.Optional[T.List[str]],
+        bands: T.Tuple[int, ...],
+    ) -> T.Callable[[T.Any, render_plan.RoomPlan], None]:
+        return lambda room_image, plan: renderer._render_objects(
+            room_image, plan.objects, game_dir, opacity, whitelist, bands
+        )
+
+    def render_sprites(
+        layer: int,
+    ) -> T.Callable[[T.Any, render_plan.RoomPlan], None]:
+        return lambda room_image, plan: renderer._render_sprites(
+            room_image, plan.sprites, state["sprites"], layer
+        )
+
+    def scale_rooms() -> None:
+        room_renderer = state["room_renderer"]
+        state["images"] = {
+            room_pos: renderer._scale_image(
+                room_image, room_renderer.get_room_size(room_pos)
+            )
+            for room_pos, room_image in state["images"].items()
+        }
+
+    def paste_rooms() -> None:
+        geometry = state["geometry"]
+        scale = args.scale
+        map_image = renderer._create_map_image(geometry, scale)
+        map_image.paste(
+            renderer._create_axis_strip_image(geometry, scale), (0, 0)
+        )
+        for world_y in range(geometry.min_y, geometry.max_y + 1):
+            strip_image = renderer._create_row_strip_image(
+                geometry, scale, world_y
+            )
+            for world_x in range(geometry.min_x, geometry.max_x + 1):
+                strip_image.paste(
+                    state["images"][world_x, world_y],
+                    (renderer._get_room_x(geometry, world_x) // scale, 0),
+                )
+            map_image.paste(
+                strip_image,
+                (0, renderer._get_room_y(geometry, world_y) // scale),
+            )
+        state["map_image"] = map_image
+
+    def save_map() -> None:
+        state["map_image"].save(os.path.join(output_dir, "map.png"))
+
+    def stream_map() -> None:
+        map_image = state["map_image"]
+        with png.PngWriter(
+            os.path.join(output_dir, "map-streamed.png"),
+            map_image.width,
+            map_image.height,
+        ) as writer:
+            writer.write_image(map_image)
+            writer.close()
+
+    def close() -> None:
+        state["world"].close()
+        state["sprites"].close()
+
+    bg_opacity = args.backgrounds_opacity
+    tiles_opacity = args.tiles_opacity
+    objects_opacity = args.objects_opacity
+    return [
+        ("index scan", scan_index),
+        ("warp extraction", extract_warps),
+        ("ini parse", parse_ini),
+        ("read world", read_world),
+        ("compile plans", compile_plans),
+        (
+            "render backgrounds",
+            render_layer(
+                lambda room_image, plan: renderer._render_background(
+                    room_image, plan.background, bg_opacity
+                )
+            ),
+        ),
+        (
+            "render objects below",
+            render_layer(render_objects(objects_opacity, None, (0,))),
+        ),
+        ("render sprites below", render_layer(render_sprites(0))),
+        (
+            "render tiles",
+            render_layer(
+                lambda room_image, plan: renderer._render_tiles(
+                    room_image, plan.tiles, game_dir, tiles_opacity
+                )
+            ),
+        ),
+        (
+            "render objects above",
+            render_layer(render_objects(objects_opacity, None, (1,))),
+        ),
+        (
+            "render whitelisted",
+            render_layer(
+                render_objects(1.0, synthetic.WHITELISTED_OBJECTS, (0, 1))
+            ),
+        ),
+        ("render sprites above", render_layer(render_sprites(1))),
+        (
+            "render texts",
+            render_layer(
+                lambda room_image, plan: renderer._render_texts(
+                    room_image, plan.texts
+                )
+            ),
+        ),
+        ("scale rooms", scale_rooms),
+        ("paste rooms", paste_rooms),
+        ("save png", save_map),
+        ("stream png", stream_map),
+        ("close", close),
+    ]
+
+
+def run_benchmark(
+    game_dir: str, args: argparse.Namespace
+) -> T.Dict[str, float]:
+    results: T.Dict[str, float] = {}
+    for _ in range(args.repeat):
+        util.clear_caches()
+        with tempfile.TemporaryDirectory() as output_dir:
+            for name, func in _get_stages(game_dir, args, output_dir):
+                elapsed = _time(func)
+                results[name] = min(results.get(name, elapsed), elapsed)
+    return results
+
+
+def print_results(
+    results: T.Dict[str, float], baseline: T.Optional[T.Dict[str, float]]
+) -> None:
+    for name, elapsed in results.items():
+        line = "%-24s %10.2f ms" % (name, elapsed * 1000)
+        if baseline and baseline.get(name):
+            line += " %+8.1f%%" % ((elapsed / baseline[name] - 1) * 100)
+        print(line)
+    print("%-24s %10.2f ms" % ("total", sum(results.values()) * 1000))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Time each rendering stage on a synthetic game."
+    )
+    parser.add_argument("--game-dir")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--scale", type=int, default=4)
+    parser.add_argument("--backgrounds-opacity", type=float, default=1.0)
+    parser.add_argument("--objects-opacity", type=float, default=1.0)
+    parser.add_argument("--tiles-opacity", type=float, default=1.0)
+    parser.add_argument("--json", dest="json_path")
+    parser.add_argument("--compare")
+    synthetic.add_density_args(parser)
+    args = parser.parse_args()
+    assert args.repeat > 0
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as handle:
+            baseline = json.load(handle)["stages"]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        game_dir = args.game_dir
+        if not game_dir:
+            game_dir = temp_dir
+            synthetic.generate_game(
+                game_dir,
+                args.width,
+                args.height,
+                synthetic.get_density(args),
+                args.seed,
+            )
+        results = run_benchmark(game_dir, args)
+
+    print("best of %d runs" % args.repeat)
+    print_results(results, baseline)
+
+    if args.json_path:
+        with open(args.json_path, "w") as handle:
+            json.dump(
+                {
+                    "params": {
+                        key: value
+                        for key, value in vars(args).items()
+                        if key not in ("json_path", "compare")
+                    },
+                    "stages": results,
+                },
+                handle,
+                indent=4,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+import argparse
+import io
+import os
+import random
+import struct
+import typing as T
+
+from PIL import Image
+
+from kug_mapper import renderer
+
+TILE_SET_NAMES = ["Synthetic %d" % i for i in range(4)]
+OBJECT_COUNT = 12
+WHITELISTED_OBJECTS = ["Kill Area 0", "Fast Travel Sign 0"]
+
+
+class Density:
+    def __init__(
+        self,
+        tiles: float = 0.6,
+        objects: int = 8,
+        sprites: int = 6,
+        warps: float = 0.2,
+        rooms: float = 1.0,
+        duplicates: float = 0.0,
+    ) -> None:
+        self.tiles = tiles
+        self.objects = objects
+        self.sprites = sprites
+        self.warps = warps
+        self.rooms = rooms
+        self.duplicates = duplicates
+
+
+def _make_tile_set_image(rng: random.Random) -> Image.Image:
+    image = Image.new(
+        mode="RGBA",
+        size=(
+            renderer.MAX_TILE_X * renderer.TILE_FULL_WIDTH,
+            renderer.MAX_TILE_Y * renderer.TILE_FULL_HEIGHT,
+        ),
+    )
+    for y in range(renderer.MAX_TILE_Y):
+        for x in range(renderer.MAX_TILE_X):
+            color = (
+                rng.randrange(256),
+                rng.randrange(256),
+                rng.randrange(256),
+                rng.choice([255, 255, 200, 120]),
+            )
+            border_x = rng.choice([0, renderer.TILE_BORDER_WIDTH])
+            border_y = rng.choice([0, renderer.TILE_BORDER_HEIGHT])
+            image.paste(
+                color,
+                (
+                    x * renderer.TILE_FULL_WIDTH + border_x,
+                    y * renderer.TILE_FULL_HEIGHT + border_y,
+                    (x + 1) * renderer.TILE_FULL_WIDTH - border_x,
+                    (y + 1) * renderer.TILE_FULL_HEIGHT - border_y,
+                ),
+            )
+    return image
+
+
+def _make_object_image(rng: random.Random) -> Image.Image:
+    return Image.new(
+        mode="RGBA",
+        size=(rng.randrange(16, 160), rng.randrange(16, 160)),
+        color=(
+            rng.randrange(256),
+            rng.randrange(256),
+            rng.randrange(256),
+            rng.choice([255, 220]),
+        ),
+    )
+
+
+def _make_objects_ini(rng: random.Random) -> str:
+    lines = []
+    for i in range(OBJECT_COUNT):
+        lines += [
+            "[Synthetic %d]" % i,
+            "Image=Synthetic %d" % i,
+            "Layer=%d" % rng.randrange(14),
+            "Scale Min=%d" % rng.randrange(50, 150),
+            "X Hotspot=%d" % rng.randrange(-10, 10),
+            "Y Hotspot=%d" % rng.randrange(-10, 10),
+            "Transparency Max=%d" % rng.choice([0, 0, 50]),
+        ]
+    for i, name in enumerate(WHITELISTED_OBJECTS):
+        lines += [
+            "[%s]" % name,
+            "Image=Synthetic %d" % i,
+            "Layer=10",
+            "Scale Min=100",
+        ]
+    return "\r\n".join(lines)
+
+
+def _get_sprite_ids() -> T.List[int]:
+    return sorted(
+        set(
+            definition[0]
+            for definition in renderer.SPRITE_DEFINITIONS.values()
+            if isinstance(definition[0], int)
+        )
+    )
+
+
+def _make_sprites_dat(rng: random.Random) -> bytes:
+    sprite_ids = _get_sprite_ids()
+    count = max(sprite_ids) + 1
+    offsets = [0] * count
+    header_size = 4 + 4 * count
+    body = bytearray()
+    for sprite_id in sprite_ids:
+        image = Image.new(
+            mode="RGBA",
+            size=(rng.randrange(16, 64), rng.randrange(16, 64)),
+            color=(
+                rng.randrange(256),
+                rng.randrange(256),
+                rng.randrange(256),
+                rng.choice([255, 200]),
+            ),
+        )
+        handle = io.BytesIO()
+        image.save(handle, format="PNG")
+        offsets[sprite_id] = header_size + len(body)
+        body += bytes(16) + handle.getvalue()
+    return (
+        struct.pack("<L", len(sprite_ids))
+        + b"".join(struct.pack("<L", offset) for offset in offsets)
+        + bytes(body)
+    )
+
+
+def _make_tiles_chunk(rng: random.Random, density: Density) -> str:
+    lines = ["[General]"]
+    lines += [
+        "Tileset %d=%s" % (i, rng.choice(TILE_SET_NAMES)) for i in range(3)
+    ]
+    lines.append("[Tile Map]")
+    for y in range(renderer.ROOM_HEIGHT):
+        row = ""
+        for _ in range(renderer.ROOM_WIDTH):
+            if rng.random() < density.tiles:
+                row += "%d%d%d" % (
+                    rng.randrange(3),
+                    rng.randrange(renderer.MAX_TILE_X),
+                    rng.randrange(renderer.MAX_TILE_Y),
+                )
+            else:
+                row += "X00"
+        lines.append("%d=%s" % (y, row))
+    return "\r\n".join(lines)
+
+
+def _make_sprites_chunk(rng: random.Random, density: Density) -> str:
+    names = sorted(renderer.SPRITE_DEFINITIONS.keys())
+    lines = ["[Null Sprite]"]
+    for i in range(rng.randrange(density.sprites + 1)):
+        lines += [
+            "[Sprite %d]" % i,
+            "Sprite=%s" % rng.choice(names),
+            "X=%d" % rng.randrange(renderer.ROOM_WIDTH),
+            "Y=%d" % rng.randrange(renderer.ROOM_HEIGHT),
+        ]
+    return "\r\n".join(lines)
+
+
+def _make_objects_chunk(rng: random.Random, density: Density) -> str:
+    names = ["Synthetic %d" % i for i in range(OBJECT_COUNT)]
+    names += WHITELISTED_OBJECTS
+    lines = ["[Null Object]"]
+    for i in range(rng.randrange(density.objects + 1)):
+        lines += [
+            "[Object %d]" % i,
+            "Object=%s" % rng.choice(names),
+            "X=%d" % rng.randrange(renderer.ROOM_WIDTH * renderer.TILE_WIDTH),
+            "Y=%d"
+            % rng.randrange(renderer.ROOM_HEIGHT * renderer.TILE_HEIGHT),
+            "Angle=%d" % rng.choice([0, 0, 0, 45, 90, 180]),
+            "RGB Coefficient=%d"
+            % rng.choice([0xFFFFFF, rng.randrange(1 << 24)]),
+        ]
+        if rng.random() < 0.3:
+            lines.append("Flip=1")
+        if rng.random() < 0.2:
+            lines.append("Scale Multiplier=%.1f" % rng.uniform(0.5, 2))
+    return "\r\n".join(lines)
+
+
+def _make_settings_chunk(rng: random.Random) -> str:
+    return "\r\n".join(
+        [
+            "[General]",
+            "Gradient Top=%d" % rng.randrange(1 << 24),
+            "Gradient Bottom=%d" % rng.randrange(1 << 24),
+        ]
+    )
+
+
+def _make_script_chunk(
+    rng: random.Random, density: Density, width: int, height: int
+) -> str:
+    lines = ["-- synthetic room"]
+    while rng.random() < density.warps:
+        lines.append(
+            "%s(%d, %d)"
+            % (
+                rng.choice(["room_set", "twilight_entrypoint"]),
+                rng.randrange(width),
+                rng.randrange(height),
+            )
+        )
+    return "\r\n".join(lines)
+
+
+def _make_chunk(x: int, y: int, name: str, content: bytes) -> bytes:
+    return (
+        ("%d,%d %s" % (x, y, name)).encode("utf-8")
+        + b"\0"
+        + struct.pack("<L", len(content))
+        + content
+    )
+
+
+def generate_game(
+    game_dir: str,
+    width: int,
+    height: int,
+    density: T.Optional[Density] = None,
+    seed: int = 0,
+) -> None:
+    assert width > 0
+    assert height > 0
+    density = density or Density()
+    assert 0 <= density.warps < 1
+    rng = random.Random(seed)
+
+    os.makedirs(os.path.join(game_dir, "Tilesets"), exist_ok=True)
+    os.makedirs(os.path.join(game_dir, "Objects"), exist_ok=True)
+
+    for name in TILE_SET_NAMES:
+        _make_tile_set_image(rng).save(
+            os.path.join(game_dir, "Tilesets", name + ".png")
+        )
+    for i in range(OBJECT_COUNT):
+        _make_object_image(rng).save(
+            os.path.join(game_dir, "Objects", "Synthetic %d.png" % i)
+        )
+    with open(
+        os.path.join(game_dir, "Objects", "Objects.ini"),
+        "w",
+        encoding="cp1250",
+    ) as handle:
+        handle.write(_make_objects_ini(rng))
+    with open(os.path.join(game_dir, "Sprites.dat"), "wb") as handle:
+        handle.write(_make_sprites_dat(rng))
+
+    rooms: T.List[T.List[T.Tuple[str, str]]] = []
+    with open(os.path.join(game_dir, "World.bin"), "wb") as handle:
+        for y in range(height):
+            for x in range(width):
+                if (x, y) not in [
+                    (0, 0),
+                    (width - 1, height - 1),
+                ] and rng.random() >= density.rooms:
+                    continue
+                if rooms and rng.random() < density.duplicates:
+                    chunks = rng.choice(rooms)
+                else:
+                    chunks = [
+                        ("Tiles", _make_tiles_chunk(rng, density)),
+                        ("Sprites", _make_sprites_chunk(rng, density)),
+                        ("Objects", _make_objects_chunk(rng, density)),
+                        ("Settings", _make_settings_chunk(rng)),
+                    ]
+                    rooms.append(chunks)
+                for name, content in chunks:
+                    handle.write(
+                        _make_chunk(x, y, name, content.encode("utf-8"))
+                    )
+                handle.write(
+                    _make_chunk(
+                        x,
+                        y,
+                        "Script",
+                        _make_script_chunk(rng, density, width, height).encode(
+                            "cp1250"
+                        ),
+                    )
+                )
+
+
+def add_density_args(parser: argparse.ArgumentParser) -> None:
+    default = Density()
+    parser.add_argument("--width", type=int, default=20)
+    parser.add_argument("--height", type=int, default=15)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tile-density", type=float, default=default.tiles)
+    parser.add_argument("--max-objects", type=int, default=default.objects)
+    parser.add_argument("--max-sprites", type=int, default=default.sprites)
+    parser.add_argument("--warp-density", type=float, default=default.warps)
+    parser.add_argument("--room-density", type=float, default=default.rooms)
+    parser.add_argument(
+        "--duplicate-rooms", type=float, default=default.duplicates
+    )
+
+
+def get_density(args: argparse.Namespace) -> Density:
+    return Density(
+        args.tile_density,
+        args.max_objects,
+        args.max_sprites,
+        args.warp_density,
+        args.room_density,
+        args.duplicate_rooms,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic Knytt Underground game directory."
+    )
+    parser.add_argument("game_dir")
+    add_density_args(parser)
+    args = parser.parse_args()
+
+    generate_game(
+        args.game_dir, args.width, args.height, get_density(args), args.seed
+    )
+
+
+if __name__ == "__main__":
+    main()
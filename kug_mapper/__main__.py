@@ -1,11 +1,21 @@
 #!/usr/bin/env python3
 import argparse
 import os
+import sys
 import typing as T
 
-from PIL import Image
-
-from kug_mapper import data_reader, renderer, util
+from kug_mapper import (
+    data_reader,
+    index_cache,
+    png,
+    profiling,
+    pyramid,
+    render_cache,
+    render_plan,
+    renderer,
+    server,
+    util,
+)
 
 
 def parse_args() -> argparse.Namespace:
@@ -23,9 +33,53 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--backgrounds-opacity", type=float, default=0.0)
     parser.add_argument("--objects-opacity", type=float, default=0.0)
     parser.add_argument("--tiles-opacity", type=float, default=0.0)
+    parser.add_argument(
+        "--world-reader", choices=["mmap", "file"], default="mmap"
+    )
+    parser.add_argument(
+        "--cache-dir", default=index_cache.get_default_cache_dir()
+    )
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--streaming", action="store_true")
+    parser.add_argument("--tiles", action="store_true")
+    parser.add_argument("--tile-size", type=int, default=256)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--rebuild-cache", action="store_true")
+    parser.add_argument("--room-cache", action="store_true")
+    parser.add_argument("--plan-cache", action="store_true")
+    parser.add_argument("--cache-max-entries", type=int)
+    parser.add_argument("--cache-max-mb", type=int)
+    parser.add_argument("--cache-stats", action="store_true")
+    parser.add_argument("--profile", metavar="PATH")
+    parser.add_argument("--prefetch-threads", type=int, default=4)
+    parser.add_argument("--profile-rooms", type=int, default=20)
+    parser.add_argument("--serve", action="store_true")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
     return parser.parse_args()
 
 
+def print_cache_stats() -> None:
+    print(
+        "%-20s %10s %10s %10s %10s %10s"
+        % ("cache", "hits", "misses", "evictions", "entries", "MiB"),
+        file=sys.stderr,
+    )
+    for name, stats in util.get_cache_stats().items():
+        print(
+            "%-20s %10d %10d %10d %10d %10.1f"
+            % (
+                name,
+                stats["hits"],
+                stats["misses"],
+                stats["evictions"],
+                stats["entries"],
+                stats["bytes"] / (1 << 20),
+            ),
+            file=sys.stderr,
+        )
+
+
 def main() -> None:
     args = parse_args()
     game_dir: str = os.path.expanduser(args.game_dir)
@@ -35,19 +89,63 @@ def main() -> None:
     tiles_opacity: float = args.tiles_opacity
     scale: int = args.scale
     output_path: str = args.output_path
+    use_mmap: bool = args.world_reader == "mmap"
+    jobs: int = args.jobs
+    streaming: bool = args.streaming
+    tiles: bool = args.tiles
+    tile_size: int = args.tile_size
+    cache_dir: str = os.path.expanduser(args.cache_dir)
+    cache: T.Optional[index_cache.IndexCache] = (
+        None
+        if args.no_cache
+        else index_cache.IndexCache(cache_dir, args.rebuild_cache)
+    )
+    room_cache: T.Optional[render_cache.RoomCache] = (
+        render_cache.RoomCache(os.path.join(cache_dir, "rooms"))
+        if args.room_cache
+        else None
+    )
+    plan_cache: T.Optional[render_plan.PlanCache] = (
+        render_plan.PlanCache(os.path.join(cache_dir, "plans"))
+        if args.plan_cache
+        else None
+    )
 
     assert 0.0 <= backgrounds_opacity <= 1.0
     assert 0.0 <= objects_opacity <= 1.0
     assert 0.0 <= tiles_opacity <= 1.0
+    assert jobs >= 1
+    assert tile_size > 0
+    assert args.profile_rooms > 0
+    assert args.prefetch_threads >= 0
+    assert args.cache_max_entries is None or args.cache_max_entries > 0
+    assert args.cache_max_mb is None or args.cache_max_mb > 0
+    if streaming and not tiles and not output_path.lower().endswith(".png"):
+        raise ValueError("Streaming output must be a PNG file")
 
-    sprites = data_reader.read_sprites(game_dir)
-    world = data_reader.read_world(game_dir, geometry)
+    util.configure_caches(
+        args.cache_max_entries,
+        args.cache_max_mb << 20 if args.cache_max_mb else None,
+    )
+    if args.profile:
+        profiling.enable(args.profile_rooms)
+
+    with profiling.measure("read_sprites"):
+        sprites = data_reader.read_sprites(game_dir, cache)
+    with profiling.measure("read_world"):
+        world = data_reader.read_world(game_dir, geometry, use_mmap, cache)
     if geometry:
         geometry.min_x = max(0, geometry.min_x)
         geometry.min_y = max(0, geometry.min_y)
         geometry.max_x = min(world.width - 1, geometry.max_x)
         geometry.max_y = min(world.height - 1, geometry.max_y)
 
+    map_width, map_height = renderer.get_map_size(
+        renderer.get_world_geometry(world, geometry), scale
+    )
+    if not map_width or not map_height:
+        raise ValueError("Scale is too large for the map")
+
     objects_whitelist = [
         "Kill Area 0",
         "Kill Area 1",
@@ -55,7 +153,7 @@ def main() -> None:
         "Fast Travel Sign 0",
     ]
 
-    map_image = renderer.render_world(
+    render_args = (
         world,
         sprites,
         backgrounds_opacity,
@@ -63,14 +161,57 @@ def main() -> None:
         objects_whitelist,
         tiles_opacity,
         geometry,
+        scale,
+        jobs,
+        room_cache,
+        plan_cache,
+        args.prefetch_threads,
     )
 
-    (
-        map_image.resize(
-            (map_image.width // scale, map_image.height // scale),
-            Image.ANTIALIAS,
-        ).save(output_path)
-    )
+    if args.serve:
+        map_server = server.MapServer(
+            world,
+            sprites,
+            objects_whitelist,
+            geometry,
+            (backgrounds_opacity, objects_opacity, tiles_opacity, scale),
+            jobs,
+            tile_size,
+            room_cache,
+            plan_cache,
+        )
+        map_server.warm_up(args.prefetch_threads)
+        server.serve(map_server, args.host, args.port)
+    elif streaming or tiles:
+        writer: T.Any
+        if tiles:
+            writer = pyramid.TilePyramidWriter(
+                output_path,
+                map_width,
+                map_height,
+                tile_size,
+                renderer.ROOM_BORDER_COLOR,
+            )
+        else:
+            writer = png.PngWriter(output_path, map_width, map_height)
+        with writer:
+            for strip_image in renderer.render_world_strips(*render_args):
+                with profiling.measure("write"):
+                    writer.write_image(strip_image)
+            with profiling.measure("write"):
+                writer.close()
+    else:
+        map_image = renderer.render_world(*render_args)
+        with profiling.measure("write"):
+            map_image.save(output_path)
+
+    if args.cache_stats:
+        print_cache_stats()
+    if args.profile:
+        profiling.write_report(args.profile)
+
+    world.close()
+    sprites.close()
 
 
 if __name__ == "__main__":
@@ -19,3 +19,14 @@ def read_zero_string(handle: T.BinaryIO) -> str:
             break
         ret += bytes([byte])
     return ret.decode("utf-8")
+
+
+def unpack_u32(buffer: T.Any, offset: int) -> int:
+    return T.cast(int, struct.unpack_from("<L", buffer, offset)[0])
+
+
+def unpack_zero_string(buffer: T.Any, offset: int) -> T.Tuple[str, int]:
+    end = buffer.find(b"\0", offset)
+    if end == -1:
+        raise ValueError("Unterminated string")
+    return buffer[offset:end].decode("utf-8"), end + 1
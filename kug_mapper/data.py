@@ -1,42 +1,170 @@
 import io
+import mmap
+import types
 import typing as T
 
+from PIL import Image
+
 from kug_mapper import binary, util
 
 
 class SpriteArchive:
-    def __init__(self, path: str, offsets: T.Dict[int, int]) -> None:
-        self._offsets = offsets
+    HEADER_SIZE = 16
+
+    def __init__(
+        self, path: str, offsets: T.Dict[int, int], max_images: int = 4096
+    ) -> None:
         self._path = path
-        with open(path, "rb") as handle:
-            handle.seek(0, io.SEEK_END)
-            file_size = handle.tell()
-            self._all_offsets = list(
-                sorted(list(offsets.values()) + [file_size])
-            )
+        self._open()
 
-    def __len__(self) -> int:
-        return len(self._offsets)
+        all_offsets = sorted(offsets.values()) + [len(self._mmap)]
+        next_offsets = dict(zip(all_offsets, all_offsets[1:]))
+        self._entries: T.Dict[int, T.Tuple[int, int]] = {
+            index: (offset, next_offsets[offset] - offset)
+            for index, offset in offsets.items()
+        }
+        self._images = util.register_cache(
+            "sprites", util.LRUCache(max_images, util.DEFAULT_CACHE_MAX_BYTES)
+        )
+
+    def __getstate__(self) -> T.Dict[str, T.Any]:
+        return {
+            "path": self._path,
+            "entries": self._entries,
+            "max_images": self._images.max_entries,
+        }
+
+    def __setstate__(self, state: T.Dict[str, T.Any]) -> None:
+        self._path = state["path"]
+        self._open()
+        self._entries = state["entries"]
+        self._images = util.register_cache(
+            "sprites",
+            util.LRUCache(state["max_images"], util.DEFAULT_CACHE_MAX_BYTES),
+        )
 
-    def read(self, index: int) -> bytes:
-        offset = self._offsets[index]
+    def _open(self) -> None:
         with open(self._path, "rb") as handle:
-            handle.seek(offset + 16)
-            size = [x for x in self._all_offsets if x > offset][0] - offset
-            return handle.read(size)
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, index: int) -> bool:
+        return index in self._entries
+
+    def read(self, index: int) -> memoryview:
+        offset, size = self._entries[index]
+        return self._view[offset + self.HEADER_SIZE : offset + size]
+
+    def read_image(self, index: int, rotation: int = 0) -> T.Any:
+        key = (index, rotation)
+        image = self._images.get(key)
+        if image is None:
+            image = Image.open(io.BytesIO(self.read(index))).convert("RGBA")
+            if rotation:
+                image = image.rotate(rotation, expand=True)
+            self._images.put(key, image)
+        return image
+
+    def close(self) -> None:
+        self._images.clear()
+        self._view.release()
+        self._mmap.close()
+
+
+class Chunk:
+    __slots__ = ("x", "y", "name", "offset", "size")
+
+    def __init__(
+        self, x: int, y: int, name: str, offset: int, size: int
+    ) -> None:
+        self.x = x
+        self.y = y
+        self.name = name
+        self.offset = offset
+        self.size = size
+
+
+Coord = T.Tuple[int, int]
+Warp = T.Tuple[int, int, int, int]
+WarpDict = T.Dict[Coord, T.List[Coord]]
+
+
+class WorldIndex:
+    def __init__(
+        self,
+        chunks: T.List[Chunk],
+        min_x: int,
+        min_y: int,
+        max_x: int,
+        max_y: int,
+        warps: T.Optional[T.List[Warp]] = None,
+    ) -> None:
+        self.chunks = chunks
+        self.warps: T.List[Warp] = [] if warps is None else warps
+        self.min_x = min_x
+        self.min_y = min_y
+        self.max_x = max_x
+        self.max_y = max_y
+
+    @property
+    def width(self) -> int:
+        return self.max_x + 1 - self.min_x
+
+    @property
+    def height(self) -> int:
+        return self.max_y + 1 - self.min_y
 
 
 class Room:
-    def __init__(self, world: "World", x: int, y: int) -> None:
+    __slots__ = ("world", "x", "y", "chunks", "_content")
+
+    def __init__(
+        self,
+        world: "World",
+        x: int,
+        y: int,
+        chunks: T.Optional[T.Mapping[str, Chunk]] = None,
+    ) -> None:
         self.world = world
         self.x: int = x
         self.y: int = y
-        self.objects: T.Any = None
-        self.robots: T.Any = None
-        self.script: T.Any = None
-        self.settings: T.Any = None
-        self.sprites: T.Any = None
-        self.tiles: T.Any = None
+        self.chunks: T.Mapping[str, Chunk] = {} if chunks is None else chunks
+        self._content: T.Dict[str, T.Any] = {}
+
+    def _load(self, name: str) -> T.Any:
+        if name not in self._content:
+            chunk = self.chunks.get(name)
+            if not chunk:
+                return None
+            self._content[name] = self.world.load_chunk(chunk)
+        return self._content[name]
+
+    @property
+    def objects(self) -> T.Any:
+        return self._load("Objects")
+
+    @property
+    def robots(self) -> T.Any:
+        return self._load("Robots")
+
+    @property
+    def script(self) -> T.Any:
+        return self._load("Script")
+
+    @property
+    def settings(self) -> T.Any:
+        return self._load("Settings")
+
+    @property
+    def sprites(self) -> T.Any:
+        return self._load("Sprites")
+
+    @property
+    def tiles(self) -> T.Any:
+        return self._load("Tiles")
 
     @property
     def pos(self) -> T.Tuple[int, int]:
@@ -44,7 +172,9 @@ class Room:
 
 
 class World:
-    def __init__(self, game_dir: str, width: int, height: int) -> None:
+    def __init__(
+        self, game_dir: str, width: int, height: int, source: T.Any = None
+    ) -> None:
         assert width
         assert height
         self.game_dir = game_dir
@@ -52,11 +182,88 @@ class World:
         self.height = height
         self.objects: T.Optional[T.Dict[str, T.Dict[str, T.Any]]] = None
         self.room_data: T.Dict[T.Tuple[int, int], Room] = {}
-        for x, y in util.range2d(self.width + 1, self.height + 1):
-            self.room_data[x, y] = Room(self, x, y)
+        self.outgoing_warps: WarpDict = {}
+        self.incoming_warps: WarpDict = {}
+        self.empty_room = Room(self, -1, -1, types.MappingProxyType({}))
+        self._source = source
 
-    def __getitem__(self, key: T.Tuple[int, int]) -> T.Any:
-        return self.room_data[key]
+    def __getitem__(self, key: T.Tuple[int, int]) -> Room:
+        return self.room_data.get(key, self.empty_room)
 
     def __iter__(self) -> T.Iterator[Room]:
         return iter(self.room_data.values())
+
+    def __len__(self) -> int:
+        return len(self.room_data)
+
+    def __getstate__(self) -> T.Dict[str, T.Any]:
+        return {
+            "game_dir": self.game_dir,
+            "width": self.width,
+            "height": self.height,
+            "objects": self.objects,
+            "chunks": [
+                chunk for room in self for chunk in room.chunks.values()
+            ],
+            "warps": [
+                (*source_pos, *target_pos)
+                for source_pos, targets in self.outgoing_warps.items()
+                for target_pos in targets
+            ],
+            "source": self._source,
+        }
+
+    def __setstate__(self, state: T.Dict[str, T.Any]) -> None:
+        self.__init__(  # type: ignore
+            state["game_dir"], state["width"], state["height"], state["source"]
+        )
+        self.objects = state["objects"]
+        for chunk in state["chunks"]:
+            self.add_chunk(chunk)
+        for warp in state["warps"]:
+            self.add_warp(warp)
+
+    def add_chunk(self, chunk: Chunk) -> None:
+        room = self.room_data.get((chunk.x, chunk.y))
+        if room is None:
+            room = self.room_data[chunk.x, chunk.y] = Room(
+                self, chunk.x, chunk.y
+            )
+        T.cast(T.Dict[str, Chunk], room.chunks)[chunk.name] = chunk
+
+    def add_warp(self, warp: Warp) -> None:
+        source_x, source_y, target_x, target_y = warp
+        self.outgoing_warps.setdefault((source_x, source_y), []).append(
+            (target_x, target_y)
+        )
+        self.incoming_warps.setdefault((target_x, target_y), []).append(
+            (source_x, source_y)
+        )
+
+    def read_chunk(self, chunk: Chunk) -> T.Any:
+        return self._source.read(chunk.offset, chunk.size)
+
+    def load_chunk(self, chunk: Chunk) -> T.Any:
+        return self._source.load(chunk)
+
+    def preload(
+        self,
+        positions: T.Iterable[T.Tuple[int, int]],
+        names: T.Optional[T.Container[str]] = None,
+    ) -> None:
+        pending = [
+            (room, name, chunk)
+            for room in (self[pos] for pos in positions)
+            for name, chunk in room.chunks.items()
+            if name not in room._content and (names is None or name in names)
+        ]
+        if not pending:
+            return
+        contents = self._source.load_many([chunk for _, _, chunk in pending])
+        for (room, name, _), content in zip(pending, contents):
+            room._content[name] = content
+
+    def close(self) -> None:
+        if self._source:
+            self._source.close()
+            self._source = None
@@ -1,99 +1,226 @@
 import io
+import mmap
 import os
 import re
+import threading
 import typing as T
 
-from kug_mapper import binary, data, util
+from kug_mapper import binary, data, index_cache, util
 
 _DATA_NAME_REGEX = r"(\d+),(\d+) (\w+)"
+_WARP_REGEX = re.compile(
+    rb"(?:twilight_entrypoint|room_set)\((\d+),[\s\x1c-\x1f\xa0]*(\d+)\)"
+)
 
 
 def _parse_ini(content: str) -> T.Dict[str, T.Any]:
     ret: T.Dict[str, T.Any] = {}
-    lines = content.replace("\r", "").split("\n")
-    for line in lines:
-        match = re.match("^\[(.*)\]$", line)
-        if match:
-            name, = match.groups()
-            ret[name] = current_obj = {}
+    current_obj: T.Dict[str, str] = {}
+    for line in content.replace("\r", "").split("\n"):
+        if line[:1] == "[" and line[-1:] == "]" and len(line) > 1:
+            ret[line[1:-1]] = current_obj = {}
             continue
 
-        match = re.match("^([^=]+)=(.*)$", line)
-        if match:
-            key, value = match.groups()
+        key, sep, value = line.partition("=")
+        if sep and key:
             current_obj[key] = value
-            continue
 
     return ret
 
 
-def _iterate_world(
-    handle: T.BinaryIO, use_content: bool
-) -> T.Iterable[T.Tuple[int, int, str, bytes]]:
-    handle.seek(0, os.SEEK_END)
-    size = handle.tell()
-    handle.seek(0)
+def _parse_chunk_name(name: str) -> T.Tuple[int, int, str]:
+    matches = re.match(_DATA_NAME_REGEX, name)
+    assert matches, "Corrupt game data"
+
+    x = int(matches.group(1))
+    y = int(matches.group(2))
+    name = matches.group(3)
+    assert x >= 0, "Negative map coordinates"
+    assert y >= 0, "Negative map coordinates"
+    return (x, y, name)
+
+
+_CHUNK_NAMES = ("Sprites", "Tiles", "Objects", "Script", "Settings", "Robots")
+
+
+def _decode_chunk(name: str, content: T.Any) -> T.Any:
+    if name == "Script":
+        return str(content, "cp1250")
+    if name in _CHUNK_NAMES:
+        return _parse_ini(str(content, "utf-8"))
+    raise ValueError("Unknown room data")
+
+
+class _WorldSource:
+    def iterate(self) -> T.Iterable[T.Tuple[int, int, str, int, int]]:
+        raise NotImplementedError()
+
+    def read(self, offset: int, size: int) -> T.Any:
+        raise NotImplementedError()
+
+    def close(self) -> None:
+        raise NotImplementedError()
+
+    def load(self, chunk: data.Chunk) -> T.Any:
+        return _decode_chunk(chunk.name, self.read(chunk.offset, chunk.size))
+
+    def load_many(self, chunks: T.List[data.Chunk]) -> T.List[T.Any]:
+        return [self.load(chunk) for chunk in chunks]
 
-    while handle.tell() < size:
-        name = binary.read_zero_string(handle)
-        content_size = binary.read_u32(handle)
 
-        content: T.Optional[bytes]
-        if use_content:
-            content = handle.read(content_size)
-        else:
+class _FileWorldSource(_WorldSource):
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._handle = open(path, "rb")
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> str:
+        return self._path
+
+    def __setstate__(self, path: str) -> None:
+        self.__init__(path)  # type: ignore
+
+    def iterate(self) -> T.Iterable[T.Tuple[int, int, str, int, int]]:
+        handle = self._handle
+        handle.seek(0, os.SEEK_END)
+        size = handle.tell()
+        handle.seek(0)
+
+        while handle.tell() < size:
+            name = binary.read_zero_string(handle)
+            content_size = binary.read_u32(handle)
+            content_offset = handle.tell()
             handle.seek(content_size, io.SEEK_CUR)
-            content = b""
 
-        matches = re.match(_DATA_NAME_REGEX, name)
-        assert matches, "Corrupt game data"
+            x, y, name = _parse_chunk_name(name)
+            yield (x, y, name, content_offset, content_size)
+
+    def read(self, offset: int, size: int) -> bytes:
+        with self._lock:
+            self._handle.seek(offset)
+            return self._handle.read(size)
+
+    def close(self) -> None:
+        self._handle.close()
+
+
+class _MappedWorldSource(_WorldSource):
+    def __init__(self, path: str) -> None:
+        self._path = path
+        with open(path, "rb") as handle:
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+    def __getstate__(self) -> str:
+        return self._path
+
+    def __setstate__(self, path: str) -> None:
+        self.__init__(path)  # type: ignore
+
+    def iterate(self) -> T.Iterable[T.Tuple[int, int, str, int, int]]:
+        buffer = self._mmap
+        size = len(buffer)
+        offset = 0
+
+        while offset < size:
+            name, offset = binary.unpack_zero_string(buffer, offset)
+            content_size = binary.unpack_u32(buffer, offset)
+            content_offset = offset + 4
+            offset = content_offset + content_size
+
+            x, y, name = _parse_chunk_name(name)
+            yield (x, y, name, content_offset, content_size)
+
+    def read(self, offset: int, size: int) -> memoryview:
+        return self._view[offset : offset + size]
+
+    def close(self) -> None:
+        self._view.release()
+        self._mmap.close()
+
+
+def _open_world_source(path: str, use_mmap: bool) -> _WorldSource:
+    if use_mmap:
+        try:
+            return _MappedWorldSource(path)
+        except (ValueError, OSError):
+            pass
+    return _FileWorldSource(path)
+
+
+def _scan_warps(
+    source: _WorldSource, chunks: T.List[data.Chunk]
+) -> T.List[data.Warp]:
+    scripts = {
+        (chunk.x, chunk.y): chunk for chunk in chunks if chunk.name == "Script"
+    }
+    ret: T.List[data.Warp] = []
+    for _, chunk in sorted(scripts.items(), key=lambda item: item[0][::-1]):
+        for match in _WARP_REGEX.finditer(
+            source.read(chunk.offset, chunk.size)
+        ):
+            ret.append((chunk.x, chunk.y, int(match[1]), int(match[2])))
+    return ret
 
-        x = int(matches.group(1))
-        y = int(matches.group(2))
-        name = matches.group(3)
-        assert x >= 0, "Negative map coordinates"
-        assert y >= 0, "Negative map coordinates"
 
-        yield (x, y, name, content)
+def _scan_world(source: _WorldSource) -> data.WorldIndex:
+    chunks = [
+        data.Chunk(x, y, name, offset, size)
+        for x, y, name, offset, size in source.iterate()
+    ]
+    assert chunks, "Empty game data"
+    return data.WorldIndex(
+        chunks,
+        min(chunk.x for chunk in chunks),
+        min(chunk.y for chunk in chunks),
+        max(chunk.x for chunk in chunks),
+        max(chunk.y for chunk in chunks),
+        _scan_warps(source, chunks),
+    )
 
 
 def read_world(
-    game_dir: str, geometry: T.Optional[util.Geometry]
+    game_dir: str,
+    geometry: T.Optional[util.Geometry],
+    use_mmap: bool = True,
+    cache: T.Optional[index_cache.IndexCache] = None,
 ) -> data.World:
     world_bin_path = os.path.join(game_dir, "World.bin")
-    with open(world_bin_path, "rb") as world_handle:
-        min_x = min(coord[0] for coord in _iterate_world(world_handle, False))
-        max_x = max(coord[0] for coord in _iterate_world(world_handle, False))
-        min_y = min(coord[1] for coord in _iterate_world(world_handle, False))
-        max_y = max(coord[1] for coord in _iterate_world(world_handle, False))
-        width = max_x + 1 - min_x
-        height = max_y + 1 - min_y
-
-        world = data.World(game_dir, width, height)
-        for x, y, name, content in _iterate_world(world_handle, True):
-            if geometry and x < geometry.min_x:
-                continue
-            if geometry and x > geometry.max_x:
-                continue
-            if geometry and y < geometry.min_y:
-                continue
-            if geometry and y > geometry.max_y:
-                continue
-
-            if name == "Sprites":
-                world[x, y].sprites = _parse_ini(content.decode("utf-8"))
-            elif name == "Tiles":
-                world[x, y].tiles = _parse_ini(content.decode("utf-8"))
-            elif name == "Objects":
-                world[x, y].objects = _parse_ini(content.decode("utf-8"))
-            elif name == "Script":
-                world[x, y].script = content.decode("cp1250")
-            elif name == "Settings":
-                world[x, y].settings = _parse_ini(content.decode("utf-8"))
-            elif name == "Robots":
-                world[x, y].robots = _parse_ini(content.decode("utf-8"))
-            else:
-                raise ValueError("Unknown room data")
+    source = _open_world_source(world_bin_path, use_mmap)
+    try:
+        index = cache.load_world_index(world_bin_path) if cache else None
+        if index is None:
+            index = _scan_world(source)
+            if cache:
+                cache.store_world_index(world_bin_path, index)
+    except:
+        source.close()
+        raise
+
+    world = data.World(game_dir, index.width, index.height, source)
+    for chunk in index.chunks:
+        x, y = chunk.x, chunk.y
+        if geometry and x < geometry.min_x:
+            continue
+        if geometry and x > geometry.max_x:
+            continue
+        if geometry and y < geometry.min_y:
+            continue
+        if geometry and y > geometry.max_y:
+            continue
+        if chunk.name not in _CHUNK_NAMES:
+            world.close()
+            raise ValueError("Unknown room data")
+        world.add_chunk(chunk)
+
+    for warp in index.warps:
+        source_x, source_y, _target_x, _target_y = warp
+        if geometry and not (
+            geometry.min_x <= source_x <= geometry.max_x
+            and geometry.min_y <= source_y <= geometry.max_y
+        ):
+            continue
+        world.add_warp(warp)
 
     objects_ini_path = os.path.join(game_dir, "Objects", "Objects.ini")
     with open(objects_ini_path, "r", encoding="cp1250") as ini_handle:
@@ -102,8 +229,14 @@ def read_world(
     return world
 
 
-def read_sprites(game_dir: str) -> data.SpriteArchive:
+def read_sprites(
+    game_dir: str, cache: T.Optional[index_cache.IndexCache] = None
+) -> data.SpriteArchive:
     path = os.path.join(game_dir, "Sprites.dat")
+    cached_offsets = cache.load_sprite_offsets(path) if cache else None
+    if cached_offsets is not None:
+        return data.SpriteArchive(path, cached_offsets)
+
     offsets: T.Dict[int, int] = {}
     with open(path, "rb") as handle:
         count = binary.read_u32(handle)
@@ -113,4 +246,6 @@ def read_sprites(game_dir: str) -> data.SpriteArchive:
             if offset:
                 offsets[i] = offset
             i += 1
-        return data.SpriteArchive(path, offsets)
+    if cache:
+        cache.store_sprite_offsets(path, offsets)
+    return data.SpriteArchive(path, offsets)
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import typing as T
+
+from kug_mapper import data
+
+CACHE_VERSION = 2
+
+
+def get_default_cache_dir() -> str:
+    return os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+        "kug_mapper",
+    )
+
+
+def _dump_world_index(index: data.WorldIndex) -> T.Any:
+    return {
+        "bounds": [index.min_x, index.min_y, index.max_x, index.max_y],
+        "chunks": [
+            [chunk.x, chunk.y, chunk.name, chunk.offset, chunk.size]
+            for chunk in index.chunks
+        ],
+        "warps": index.warps,
+    }
+
+
+def _load_world_index(payload: T.Any) -> data.WorldIndex:
+    min_x, min_y, max_x, max_y = payload["bounds"]
+    return data.WorldIndex(
+        [
+            data.Chunk(int(x), int(y), str(name), int(offset), int(size))
+            for x, y, name, offset, size in payload["chunks"]
+        ],
+        int(min_x),
+        int(min_y),
+        int(max_x),
+        int(max_y),
+        [
+            (int(source_x), int(source_y), int(target_x), int(target_y))
+            for source_x, source_y, target_x, target_y in payload["warps"]
+        ],
+    )
+
+
+def _dump_sprite_offsets(offsets: T.Dict[int, int]) -> T.Any:
+    return list(offsets.items())
+
+
+def _load_sprite_offsets(payload: T.Any) -> T.Dict[int, int]:
+    return {int(index): int(offset) for index, offset in payload}
+
+
+class IndexCache:
+    def __init__(self, cache_dir: str, rebuild: bool = False) -> None:
+        self.cache_dir = cache_dir
+        self.rebuild = rebuild
+
+    def _get_cache_path(self, kind: str, path: str) -> str:
+        digest = hashlib.sha1(os.path.abspath(path).encode("utf-8"))
+        return os.path.join(
+            self.cache_dir, "%s-%s.json" % (kind, digest.hexdigest())
+        )
+
+    def _get_key(self, path: str) -> T.Any:
+        stat = os.stat(path)
+        return [
+            CACHE_VERSION,
+            os.path.abspath(path),
+            stat.st_size,
+            stat.st_mtime_ns,
+        ]
+
+    def _load(self, kind: str, path: str) -> T.Any:
+        if self.rebuild:
+            return None
+        try:
+            with open(self._get_cache_path(kind, path), "r") as handle:
+                content = json.load(handle)
+            if content["key"] != self._get_key(path):
+                return None
+            return content["payload"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _store(self, kind: str, path: str, payload: T.Any) -> None:
+        cache_path = self._get_cache_path(kind, path)
+        temp_path = "%s.%d.tmp" % (cache_path, os.getpid())
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(temp_path, "w") as handle:
+                json.dump(
+                    {"key": self._get_key(path), "payload": payload}, handle
+                )
+            os.replace(temp_path, cache_path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+    def load_world_index(self, path: str) -> T.Optional[data.WorldIndex]:
+        payload = self._load("world", path)
+        if payload is None:
+            return None
+        try:
+            return _load_world_index(payload)
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def store_world_index(self, path: str, index: data.WorldIndex) -> None:
+        self._store("world", path, _dump_world_index(index))
+
+    def load_sprite_offsets(self, path: str) -> T.Optional[T.Dict[int, int]]:
+        payload = self._load("sprites", path)
+        if payload is None:
+            return None
+        try:
+            return _load_sprite_offsets(payload)
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def store_sprite_offsets(
+        self, path: str, offsets: T.Dict[int, int]
+    ) -> None:
+        self._store("sprites", path, _dump_sprite_offsets(offsets))
@@ -0,0 +1,65 @@
+import struct
+import typing as T
+import zlib
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+IDAT_SIZE = 1 << 20
+
+
+class PngWriter:
+    def __init__(self, path: str, width: int, height: int) -> None:
+        assert width > 0
+        assert height > 0
+        self.width = width
+        self.height = height
+        self._rows = 0
+        self._pending = bytearray()
+        self._compressor = zlib.compressobj(6)
+        self._handle = open(path, "wb")
+        self._handle.write(PNG_SIGNATURE)
+        self._write_chunk(
+            b"IHDR", struct.pack(">LLBBBBB", width, height, 8, 2, 0, 0, 0)
+        )
+
+    def __enter__(self) -> "PngWriter":
+        return self
+
+    def __exit__(self, *args: T.Any) -> None:
+        self._handle.close()
+
+    def _write_chunk(self, kind: bytes, content: bytes) -> None:
+        self._handle.write(struct.pack(">L", len(content)))
+        self._handle.write(kind)
+        self._handle.write(content)
+        self._handle.write(
+            struct.pack(">L", zlib.crc32(content, zlib.crc32(kind)))
+        )
+
+    def _write_data(self, content: bytes) -> None:
+        self._pending += content
+        if len(self._pending) >= IDAT_SIZE:
+            self._write_chunk(b"IDAT", bytes(self._pending))
+            self._pending.clear()
+
+    def write_image(self, image: T.Any) -> None:
+        assert image.mode == "RGB"
+        assert image.width == self.width
+        assert self._rows + image.height <= self.height
+        content = image.tobytes()
+        stride = self.width * 3
+        for offset in range(0, len(content), stride):
+            self._write_data(
+                self._compressor.compress(
+                    b"\0" + content[offset : offset + stride]
+                )
+            )
+        self._rows += image.height
+
+    def close(self) -> None:
+        assert self._rows == self.height, "Incomplete image"
+        self._write_data(self._compressor.flush())
+        if self._pending:
+            self._write_chunk(b"IDAT", bytes(self._pending))
+            self._pending.clear()
+        self._write_chunk(b"IEND", b"")
+        self._handle.close()
@@ -0,0 +1,163 @@
+import contextlib
+import heapq
+import json
+import threading
+import time
+import typing as T
+
+from kug_mapper import util
+
+try:
+    import resource
+except ImportError:
+    resource = None  # type: ignore
+
+Snapshot = T.Dict[str, T.Any]
+
+
+class Profiler:
+    def __init__(self, max_rooms: int = 20) -> None:
+        self.max_rooms = max_rooms
+        self.stages: T.Dict[str, T.List[float]] = {}
+        self.rooms: T.List[T.Tuple[float, int, int]] = []
+        self.foreign_snapshots: T.Dict[T.Any, Snapshot] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, elapsed: float) -> None:
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = [0.0, 0]
+            stage[0] += elapsed
+            stage[1] += 1
+
+    def add_room(self, room_pos: T.Tuple[int, int], elapsed: float) -> None:
+        item = (elapsed, *room_pos)
+        with self._lock:
+            if len(self.rooms) < self.max_rooms:
+                heapq.heappush(self.rooms, item)
+            elif self.rooms and item > self.rooms[0]:
+                heapq.heapreplace(self.rooms, item)
+
+    def add_snapshot(self, source: T.Any, snapshot: Snapshot) -> None:
+        with self._lock:
+            self.foreign_snapshots[source] = snapshot
+
+    def get_local_snapshot(self) -> Snapshot:
+        with self._lock:
+            return {
+                "stages": {
+                    name: list(stage) for name, stage in self.stages.items()
+                },
+                "rooms": list(self.rooms),
+            }
+
+    def get_snapshot(self) -> Snapshot:
+        stages: T.Dict[str, T.List[float]] = {}
+        rooms: T.List[T.Tuple[float, int, int]] = []
+        with self._lock:
+            foreign_snapshots = list(self.foreign_snapshots.values())
+        for snapshot in [self.get_local_snapshot(), *foreign_snapshots]:
+            for name, (elapsed, calls) in snapshot["stages"].items():
+                stage = stages.setdefault(name, [0.0, 0])
+                stage[0] += elapsed
+                stage[1] += calls
+            rooms += snapshot["rooms"]
+        return {
+            "stages": stages,
+            "rooms": sorted(rooms, reverse=True)[: self.max_rooms],
+        }
+
+
+_profiler: T.Optional[Profiler] = None
+
+
+def enable(max_rooms: int = 20) -> None:
+    global _profiler
+    _profiler = Profiler(max_rooms)
+
+
+def get_max_rooms() -> T.Optional[int]:
+    return _profiler.max_rooms if _profiler else None
+
+
+@contextlib.contextmanager
+def measure(name: str) -> T.Iterator[None]:
+    if _profiler is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _profiler.add(name, time.perf_counter() - start)
+
+
+@contextlib.contextmanager
+def measure_room(room_pos: T.Tuple[int, int]) -> T.Iterator[None]:
+    if _profiler is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _profiler.add("room", elapsed)
+        _profiler.add_room(room_pos, elapsed)
+
+
+def get_local_snapshot() -> T.Optional[Snapshot]:
+    return _profiler.get_local_snapshot() if _profiler else None
+
+
+def record_snapshot(source: T.Any, snapshot: T.Optional[Snapshot]) -> None:
+    if _profiler and snapshot:
+        _profiler.add_snapshot(source, snapshot)
+
+
+def _get_peak_rss() -> T.Dict[str, T.Optional[int]]:
+    if resource is None:
+        return {"self_kib": None, "children_kib": None}
+    return {
+        "self_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "children_kib": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    }
+
+
+def write_report(path: str) -> None:
+    assert _profiler
+    snapshot = _profiler.get_snapshot()
+    cache_stats = util.get_cache_stats()
+    for stats in cache_stats.values():
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else None
+    with open(path, "w") as handle:
+        json.dump(
+            {
+                "stages": {
+                    name: {"seconds": elapsed, "calls": calls}
+                    for name, (elapsed, calls) in sorted(
+                        snapshot["stages"].items(),
+                        key=lambda item: -item[1][0],
+                    )
+                },
+                "slowest_rooms": [
+                    {
+                        "room": "%s%s"
+                        % (
+                            util.number_to_spreadsheet_notation(x + 1),
+                            y + 1,
+                        ),
+                        "x": x,
+                        "y": y,
+                        "seconds": elapsed,
+                    }
+                    for elapsed, x, y in snapshot["rooms"]
+                ],
+                "caches": cache_stats,
+                "peak_rss": _get_peak_rss(),
+            },
+            handle,
+            indent=4,
+        )
@@ -0,0 +1,155 @@
+import json
+import os
+import typing as T
+
+from PIL import Image
+
+ImageObj = T.Any
+Color = T.Any
+
+
+def _ceil_div(a: int, b: int) -> int:
+    return -(-a // b)
+
+
+class _PyramidLevel:
+    def __init__(
+        self,
+        output_dir: str,
+        zoom: int,
+        width: int,
+        height: int,
+        tile_size: int,
+        background: Color,
+        parent: T.Optional["_PyramidLevel"],
+    ) -> None:
+        self.output_dir = output_dir
+        self.zoom = zoom
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.background = background
+        self.parent = parent
+        self._band_width = _ceil_div(width, tile_size) * tile_size
+        self._band: T.Optional[ImageObj] = None
+        self._band_rows = 0
+        self._tile_y = 0
+
+    def write_image(self, image: ImageObj) -> None:
+        y = 0
+        while y < image.height:
+            if self._band is None:
+                self._band = Image.new(
+                    mode="RGB",
+                    size=(self._band_width, self.tile_size),
+                    color=self.background,
+                )
+                self._band_rows = 0
+            rows = min(image.height - y, self.tile_size - self._band_rows)
+            self._band.paste(
+                image.crop((0, y, image.width, y + rows)),
+                (0, self._band_rows),
+            )
+            self._band_rows += rows
+            y += rows
+            if self._band_rows == self.tile_size:
+                self._flush_band()
+
+    def _flush_band(self) -> None:
+        assert self._band is not None
+        band, rows = self._band, self._band_rows
+        self._band = None
+        self._band_rows = 0
+
+        for tile_x in range(self._band_width // self.tile_size):
+            tile_dir = os.path.join(
+                self.output_dir, str(self.zoom), str(tile_x)
+            )
+            os.makedirs(tile_dir, exist_ok=True)
+            band.crop(
+                (
+                    tile_x * self.tile_size,
+                    0,
+                    (tile_x + 1) * self.tile_size,
+                    self.tile_size,
+                )
+            ).save(os.path.join(tile_dir, "%d.png" % self._tile_y))
+        self._tile_y += 1
+
+        if self.parent:
+            self.parent.write_image(
+                band.crop((0, 0, self._band_width, rows)).resize(
+                    (self._band_width // 2, _ceil_div(rows, 2)),
+                    Image.ANTIALIAS,
+                )
+            )
+
+    def close(self) -> None:
+        if self._band is not None:
+            self._flush_band()
+        if self.parent:
+            self.parent.close()
+
+
+def get_max_zoom(width: int, height: int, tile_size: int) -> int:
+    max_zoom = 0
+    while max(width, height) > tile_size << max_zoom:
+        max_zoom += 1
+    return max_zoom
+
+
+class TilePyramidWriter:
+    def __init__(
+        self,
+        output_dir: str,
+        width: int,
+        height: int,
+        tile_size: int = 256,
+        background: Color = "black",
+    ) -> None:
+        assert width > 0
+        assert height > 0
+        self.output_dir = output_dir
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.max_zoom = get_max_zoom(width, height, tile_size)
+
+        level: T.Optional[_PyramidLevel] = None
+        for zoom in range(self.max_zoom + 1):
+            level = _PyramidLevel(
+                output_dir,
+                zoom,
+                _ceil_div(width, 1 << (self.max_zoom - zoom)),
+                _ceil_div(height, 1 << (self.max_zoom - zoom)),
+                tile_size,
+                background,
+                level,
+            )
+        assert level
+        self._base_level = level
+
+    def __enter__(self) -> "TilePyramidWriter":
+        return self
+
+    def __exit__(self, *args: T.Any) -> None:
+        pass
+
+    def write_image(self, image: ImageObj) -> None:
+        self._base_level.write_image(image)
+
+    def close(self) -> None:
+        self._base_level.close()
+        with open(
+            os.path.join(self.output_dir, "metadata.json"), "w"
+        ) as handle:
+            json.dump(
+                {
+                    "width": self.width,
+                    "height": self.height,
+                    "tile_size": self.tile_size,
+                    "min_zoom": 0,
+                    "max_zoom": self.max_zoom,
+                },
+                handle,
+            )
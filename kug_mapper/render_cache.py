@@ -0,0 +1,67 @@
+import hashlib
+import os
+import typing as T
+
+from PIL import Image
+
+from kug_mapper import util
+
+ImageObj = T.Any
+
+
+def get_assets_stamp(game_dir: str) -> str:
+    paths = [
+        os.path.join(game_dir, "Sprites.dat"),
+        os.path.join(game_dir, "Objects", "Objects.ini"),
+    ]
+    for dir_name in ("Objects", "Tilesets"):
+        dir_path = os.path.join(game_dir, dir_name)
+        if os.path.isdir(dir_path):
+            paths += [entry.path for entry in util.scan_tree(dir_path)]
+
+    digest = hashlib.sha1()
+    for path in sorted(set(paths)):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        digest.update(
+            (
+                "%s %d %d\n"
+                % (
+                    os.path.relpath(path, game_dir),
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                )
+            ).encode("utf-8")
+        )
+    return digest.hexdigest()
+
+
+class RoomCache:
+    def __init__(self, cache_dir: str) -> None:
+        self.cache_dir = cache_dir
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + ".png")
+
+    def load(self, key: str) -> T.Optional[ImageObj]:
+        try:
+            image = Image.open(self._get_path(key))
+            image.load()
+        except (OSError, ValueError):
+            return None
+        if image.mode != "RGB":
+            return None
+        return image
+
+    def store(self, key: str, image: ImageObj) -> None:
+        path = self._get_path(key)
+        temp_path = "%s.%d.tmp" % (path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            image.save(temp_path, format="PNG", compress_level=1)
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
@@ -0,0 +1,140 @@
+import json
+import os
+import typing as T
+
+from kug_mapper import util
+
+Color = T.Any
+TileDraw = T.Tuple[int, int, str, int, int]
+ObjectDraw = T.Tuple[int, str, str, Color, float, float, bool, float, int, int]
+SpriteDraw = T.Tuple[int, int, int, T.Union[int, Color], int]
+TextDraw = T.Tuple[float, float, str, Color, bool]
+
+PLAN_VERSION = 2
+
+
+class RoomPlan:
+    __slots__ = (
+        "background",
+        "tiles",
+        "objects",
+        "sprites",
+        "texts",
+        "unknown_sprites",
+    )
+
+    def __init__(
+        self,
+        background: T.Optional[T.Tuple[Color, Color]],
+        tiles: T.List[TileDraw],
+        objects: T.List[ObjectDraw],
+        sprites: T.List[SpriteDraw],
+        texts: T.List[TextDraw],
+        unknown_sprites: T.List[str],
+    ) -> None:
+        self.background = background
+        self.tiles = tiles
+        self.objects = objects
+        self.sprites = sprites
+        self.texts = texts
+        self.unknown_sprites = unknown_sprites
+
+
+def _to_color(value: T.Any) -> Color:
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
+
+def _dump_room_plan(plan: RoomPlan) -> T.Any:
+    return {
+        "background": plan.background,
+        "tiles": plan.tiles,
+        "objects": plan.objects,
+        "sprites": plan.sprites,
+        "texts": plan.texts,
+        "unknown_sprites": plan.unknown_sprites,
+    }
+
+
+def _load_room_plan(payload: T.Any) -> RoomPlan:
+    background = payload["background"]
+    return RoomPlan(
+        (
+            (_to_color(background[0]), _to_color(background[1]))
+            if background
+            else None
+        ),
+        [
+            (int(x), int(y), str(name), int(tile_x), int(tile_y))
+            for x, y, name, tile_x, tile_y in payload["tiles"]
+        ],
+        [
+            (
+                int(band),
+                str(object_name),
+                str(image_name),
+                _to_color(color),
+                alpha,
+                scale,
+                bool(flip),
+                angle,
+                int(x),
+                int(y),
+            )
+            for (
+                band,
+                object_name,
+                image_name,
+                color,
+                alpha,
+                scale,
+                flip,
+                angle,
+                x,
+                y,
+            ) in payload["objects"]
+        ],
+        [
+            (int(layer), int(x), int(y), _to_color(sprite_id), int(rotation))
+            for layer, x, y, sprite_id, rotation in payload["sprites"]
+        ],
+        [
+            (x, y, str(text), _to_color(fill), bool(overlay))
+            for x, y, text, fill, overlay in payload["texts"]
+        ],
+        [str(name) for name in payload["unknown_sprites"]],
+    )
+
+
+def get_plan_size(plan: RoomPlan) -> int:
+    return util.get_value_size(
+        [plan.tiles, plan.objects, plan.sprites, plan.texts]
+    )
+
+
+class PlanCache:
+    def __init__(self, cache_dir: str) -> None:
+        self.cache_dir = cache_dir
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def load(self, key: str) -> T.Optional[RoomPlan]:
+        try:
+            with open(self._get_path(key), "r") as handle:
+                return _load_room_plan(json.load(handle))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def store(self, key: str, plan: RoomPlan) -> None:
+        path = self._get_path(key)
+        temp_path = "%s.%d.tmp" % (path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp_path, "w") as handle:
+                json.dump(_dump_room_plan(plan), handle)
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
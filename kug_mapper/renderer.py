@@ -1,5 +1,8 @@
-import io
+import collections
+import concurrent.futures
+import hashlib
 import math
+import multiprocessing
 import os
 import random
 import re
@@ -8,12 +11,13 @@ import typing as T
 
 from PIL import Image, ImageDraw, ImageFont, ImageMath
 
-from kug_mapper import data, util
+from kug_mapper import data, profiling, render_cache, render_plan, util
 
 ImageObj = T.Any
 Color = T.Union[T.Tuple[int, int, int], T.Tuple[int, int, int, int]]
 Coord = T.Tuple[int, int]
 WarpDict = T.Dict[Coord, T.List[Coord]]
+Assets = T.Tuple[T.List[str], T.List[str], T.List[T.Tuple[int, int]]]
 
 ROOM_WIDTH = 31
 ROOM_HEIGHT = 18
@@ -27,6 +31,9 @@ MAX_TILE_X = 5
 MAX_TILE_Y = 5
 FONT_SIZE = 50
 FONT_NAME = "DejaVuSansMono.ttf"
+ROOM_CACHE_VERSION = 2
+RENDER_LOOKAHEAD = 8
+_RENDER_CHUNK_NAMES = ("Objects", "Settings", "Sprites", "Tiles")
 
 OUTGOING_WARP_FONT_COLOR = "red"
 INCOMING_WARP_FONT_COLOR = "magenta"
@@ -196,22 +203,31 @@ def _get_room_name(x: int, y: int) -> str:
     return _get_room_name_x(x) + _get_room_name_y(y)
 
 
-def _darken_image(image: ImageObj, coeff: float) -> ImageObj:
-    coefficients = (coeff, coeff, coeff, 1)
-    return Image.merge(
-        "RGBA",
-        [
-            ImageMath.eval(
-                'convert(convert(image, "F") * coeff, "L")',
-                image=band,
-                coeff=coefficients[i],
-            )
-            for i, band in enumerate(image.split())
-        ],
+@util.lru_memoize("multiply_luts", max_entries=1024)
+def _get_multiply_lut(coeff: float) -> T.List[int]:
+    ramp = Image.frombytes("L", (256, 1), bytes(range(256)))
+    return list(
+        ImageMath.eval(
+            'convert(convert(image, "F") * coeff, "L")',
+            image=ramp,
+            coeff=coeff,
+        ).getdata()
     )
 
 
-@util.memoize
+def _multiply_image(
+    image: ImageObj, coefficients: T.Sequence[float]
+) -> ImageObj:
+    return image.point(
+        [value for coeff in coefficients for value in _get_multiply_lut(coeff)]
+    )
+
+
+def _darken_image(image: ImageObj, coeff: float) -> ImageObj:
+    return _multiply_image(image, (coeff, coeff, coeff, 1))
+
+
+@util.lru_memoize("tile_sets")
 def _read_tile_set_image(game_dir: str, name: str) -> ImageObj:
     tile_set_path = os.path.join(game_dir, "Tilesets", name + ".png")
     if os.path.exists(tile_set_path):
@@ -226,42 +242,107 @@ def _read_tile_set_image(game_dir: str, name: str) -> ImageObj:
     )
 
 
-@util.memoize
+@util.lru_memoize("dark_tile_sets")
+def _read_dark_tile_set_image(
+    game_dir: str, name: str, darken_coefficient: float
+) -> ImageObj:
+    return _darken_image(
+        _read_tile_set_image(game_dir, name), darken_coefficient
+    )
+
+
+@util.lru_memoize("tiles")
 def _read_tile_image(
     game_dir: str, name: str, x: int, y: int, darken_coefficient: float
 ) -> ImageObj:
-    return _darken_image(
-        _read_tile_set_image(game_dir, name).crop(
-            (
-                x * TILE_FULL_WIDTH,
-                y * TILE_FULL_HEIGHT,
-                (x + 1) * TILE_FULL_WIDTH,
-                (y + 1) * TILE_FULL_HEIGHT,
-            )
-        ),
-        darken_coefficient,
+    return _read_dark_tile_set_image(game_dir, name, darken_coefficient).crop(
+        (
+            x * TILE_FULL_WIDTH,
+            y * TILE_FULL_HEIGHT,
+            (x + 1) * TILE_FULL_WIDTH,
+            (y + 1) * TILE_FULL_HEIGHT,
+        )
     )
 
 
-@util.memoize
+@util.lru_memoize("tile_stamps")
+def _read_tile_stamp(
+    game_dir: str, name: str, x: int, y: int, darken_coefficient: float
+) -> T.Optional[T.Tuple[ImageObj, T.Optional[ImageObj], int, int]]:
+    tile_image = _read_tile_image(game_dir, name, x, y, darken_coefficient)
+    alpha = tile_image.getchannel("A")
+    bbox = alpha.getbbox()
+    if not bbox:
+        return None
+    tile_image = tile_image.crop(bbox)
+    if alpha.crop(bbox).getextrema() == (255, 255):
+        return (
+            tile_image.convert("RGB"),
+            None,
+            bbox[0] - TILE_BORDER_WIDTH,
+            bbox[1] - TILE_BORDER_HEIGHT,
+        )
+    return (
+        tile_image,
+        tile_image,
+        bbox[0] - TILE_BORDER_WIDTH,
+        bbox[1] - TILE_BORDER_HEIGHT,
+    )
+
+
+@util.lru_memoize("objects")
 def _read_object_image(game_dir: str, name: str) -> ImageObj:
     object_path = os.path.join(game_dir, "Objects", name + ".png")
     return Image.open(object_path).convert("RGBA")
 
 
-@util.memoize
+@util.lru_memoize("object_transforms", 1024)
+def _create_object_image(
+    game_dir: str,
+    name: str,
+    color: T.Tuple[float, ...],
+    scale: float,
+    flip: bool,
+    angle: float,
+) -> ImageObj:
+    object_tile = _multiply_image(
+        _read_object_image(game_dir, name),
+        [component / 255.0 for component in color],
+    )
+    object_tile = object_tile.resize(
+        (int(object_tile.width * scale), int(object_tile.height * scale))
+    )
+    if flip:
+        object_tile = object_tile.transpose(Image.FLIP_LEFT_RIGHT)
+    return object_tile.rotate(angle, expand=True)
+
+
+@util.lru_memoize("object_sizes")
+def _get_object_size(
+    game_dir: str, name: str, scale: float, angle: float
+) -> T.Tuple[int, int]:
+    width, height = _read_object_image(game_dir, name).size
+    return (
+        Image.new(mode="L", size=(int(width * scale), int(height * scale)))
+        .rotate(angle, expand=True)
+        .size
+    )
+
+
 def _create_sprite_image(
     sprites: data.SpriteArchive, sprite_id: T.Union[int, Color], rotation: int
 ) -> ImageObj:
     if isinstance(sprite_id, int):
-        content = sprites.read(sprite_id)
-        ret = Image.open(io.BytesIO(content)).convert("RGBA")
-    else:
-        ret = _create_solid_tile_image(sprite_id)
-    return ret.rotate(rotation, expand=True)
+        return sprites.read_image(sprite_id, rotation)
+    return _create_solid_sprite_image(sprite_id, rotation)
 
 
-@util.memoize
+@util.lru_memoize("solid_sprites")
+def _create_solid_sprite_image(color: Color, rotation: int) -> ImageObj:
+    return _create_solid_tile_image(color).rotate(rotation, expand=True)
+
+
+@util.lru_memoize("solid_tiles")
 def _create_solid_tile_image(color: Color) -> ImageObj:
     image = Image.new(
         mode="RGBA",
@@ -291,134 +372,211 @@ def _mix_rgb(color1: Color, color2: Color, delta: float) -> Color:
     )
 
 
-def _render_backgrounds(
-    room_image: ImageObj, room_data: data.Room, opacity: float
-) -> None:
-    if not opacity:
-        return
-    color1 = _to_rgb(int(room_data.settings["General"]["Gradient Top"]))
-    color2 = _to_rgb(int(room_data.settings["General"]["Gradient Bottom"]))
-    draw = ImageDraw.Draw(room_image)
-    for room_y in range(ROOM_HEIGHT * TILE_HEIGHT):
-        new_color = _mix_rgb(
-            color1, color2, room_y / (ROOM_HEIGHT * TILE_HEIGHT)
-        )
+@util.lru_memoize("backgrounds")
+def _create_background_image(
+    color1: Color, color2: Color, opacity: float
+) -> ImageObj:
+    height = ROOM_HEIGHT * TILE_HEIGHT
+    column = bytearray()
+    for room_y in range(height):
+        new_color = _mix_rgb(color1, color2, room_y / height)
         new_color = _mix_rgb(DEFAULT_BACKGROUND, new_color, opacity)
-        draw.rectangle((0, room_y, room_image.width, room_y), fill=new_color)
+        column += bytes(new_color)
+    return Image.frombytes("RGB", (1, height), bytes(column)).resize(
+        (ROOM_WIDTH * TILE_WIDTH, height), Image.NEAREST
+    )
 
 
-def _render_tiles(
-    room_image: ImageObj, room_data: data.Room, opacity: float
+def _get_background_colors(
+    room_data: data.Room,
+) -> T.Optional[T.Tuple[Color, Color]]:
+    settings = (room_data.settings or {}).get("General", {})
+    if "Gradient Top" not in settings or "Gradient Bottom" not in settings:
+        return None
+    return (
+        _to_rgb(int(settings["Gradient Top"])),
+        _to_rgb(int(settings["Gradient Bottom"])),
+    )
+
+
+def _render_background(
+    room_image: ImageObj,
+    colors: T.Optional[T.Tuple[Color, Color]],
+    opacity: float,
 ) -> None:
+    if not opacity or not colors:
+        return
+    room_image.paste(_create_background_image(*colors, opacity))
+
+
+def _decode_tile_map(
+    tiles: T.Dict[str, T.Any],
+) -> T.List[T.Tuple[int, int, int, int, int]]:
+    ret = []
+    tile_map = tiles["Tile Map"]
+    for room_y in range(ROOM_HEIGHT):
+        row = tile_map[str(room_y)]
+        for room_x in range(ROOM_WIDTH):
+            tile_str = row[room_x * 3 : room_x * 3 + 3]
+            if tile_str[0] == "X":
+                continue
+            ret.append(
+                (
+                    room_x,
+                    room_y,
+                    int(tile_str[0]),
+                    int(tile_str[1]),
+                    int(tile_str[2]),
+                )
+            )
+    return ret
+
+
+def _get_tile_draws(room_data: data.Room) -> T.List[render_plan.TileDraw]:
+    if not room_data.tiles:
+        return []
     tile_set_names = [
         room_data.tiles["General"]["Tileset %d" % i] for i in range(3)
     ]
-
-    for room_x, room_y in util.range2d(ROOM_WIDTH, ROOM_HEIGHT):
-        tile_str = room_data.tiles["Tile Map"][str(room_y)][
-            room_x * 3 : room_x * 3 + 3
-        ]
-
-        if tile_str[0] == "X":
-            continue
-
-        tile_set_index = int(tile_str[0])
-        tile_set_x = int(tile_str[1])
-        tile_set_y = int(tile_str[2])
-        tile_image = _read_tile_image(
-            room_data.world.game_dir,
+    return [
+        (
+            room_x * TILE_WIDTH,
+            room_y * TILE_HEIGHT,
             tile_set_names[tile_set_index],
             tile_set_x,
             tile_set_y,
-            opacity,
         )
+        for (
+            room_x,
+            room_y,
+            tile_set_index,
+            tile_set_x,
+            tile_set_y,
+        ) in _decode_tile_map(room_data.tiles)
+    ]
+
+
+def _render_tiles(
+    room_image: ImageObj,
+    tile_draws: T.List[render_plan.TileDraw],
+    game_dir: str,
+    opacity: float,
+) -> None:
+    paste = room_image.paste
+    for x, y, tile_set_name, tile_set_x, tile_set_y in tile_draws:
+        tile_stamp = _read_tile_stamp(
+            game_dir, tile_set_name, tile_set_x, tile_set_y, opacity
+        )
+        if not tile_stamp:
+            continue
 
-        room_image.paste(
-            tile_image,
+        tile_image, tile_mask, offset_x, offset_y = tile_stamp
+        paste(tile_image, (x + offset_x, y + offset_y), tile_mask)
+
+
+def _get_sprite_draws(room_data: data.Room) -> T.List[render_plan.SpriteDraw]:
+    placed = []
+    for key, sprite in (room_data.sprites or {}).items():
+        if (
+            key == "Null Sprite"
+            or "Sprite" not in sprite
+            or "X" not in sprite
+            or "Y" not in sprite
+            or sprite["Sprite"] not in SPRITE_DEFINITIONS
+        ):
+            continue
+        room_x = int(sprite["X"])
+        room_y = int(sprite["Y"])
+        if 0 <= room_x < ROOM_WIDTH and 0 <= room_y < ROOM_HEIGHT:
+            placed.append(
+                (room_y, room_x, SPRITE_DEFINITIONS[sprite["Sprite"]])
+            )
+    placed.sort(key=lambda item: (item[0], item[1]))
+
+    ret = []
+    for room_y, room_x, definition in placed:
+        sprite_id, offset_x, offset_y, layer, rotation = definition
+        ret.append(
             (
-                room_x * TILE_WIDTH - TILE_BORDER_WIDTH,
-                room_y * TILE_HEIGHT - TILE_BORDER_HEIGHT,
-            ),
-            tile_image,
+                layer,
+                room_x * TILE_WIDTH + offset_x,
+                room_y * TILE_HEIGHT + offset_y,
+                sprite_id,
+                rotation,
+            )
         )
+    return ret
 
 
-def _render_sprites(
-    room_image: ImageObj,
-    room_data: data.Room,
-    sprites: data.SpriteArchive,
-    layer_to_draw: int,
-) -> None:
-    for room_x, room_y in util.range2d(ROOM_WIDTH, ROOM_HEIGHT):
-        for sprite_id, offset_x, offset_y, layer, rotation in [
-            SPRITE_DEFINITIONS[sprite["Sprite"]]
-            for key, sprite in room_data.sprites.items()
-            if key != "Null Sprite"
-            and "Sprite" in sprite
-            and "X" in sprite
+def _get_unknown_sprites(room_data: data.Room) -> T.List[str]:
+    return sorted(
+        set(
+            sprite["Sprite"]
+            for sprite in (room_data.sprites or {}).values()
+            if "X" in sprite
             and "Y" in sprite
-            and sprite["Sprite"] in SPRITE_DEFINITIONS
-            and int(sprite["X"]) == room_x
-            and int(sprite["Y"]) == room_y
-        ]:
-            if layer != layer_to_draw:
-                continue
-            sprite_image = _create_sprite_image(sprites, sprite_id, rotation)
-            room_image.paste(
-                sprite_image,
-                (
-                    room_x * TILE_WIDTH + offset_x,
-                    room_y * TILE_HEIGHT + offset_y,
-                ),
-                sprite_image,
-            )
+            and "Sprite" in sprite
+            and sprite["Sprite"] not in SPRITE_DEFINITIONS
+        )
+    )
 
 
-def _render_objects(
+def _render_sprites(
     room_image: ImageObj,
-    room_data: data.Room,
-    world: data.World,
-    opacity: float,
-    whitelist: T.Optional[T.List[str]],
-    layers: T.Any,
+    sprite_draws: T.List[render_plan.SpriteDraw],
+    sprites: data.SpriteArchive,
+    layer_to_draw: int,
 ) -> None:
-    if not opacity:
-        return
+    for layer, x, y, sprite_id, rotation in sprite_draws:
+        if layer != layer_to_draw:
+            continue
+        sprite_image = _create_sprite_image(sprites, sprite_id, rotation)
+        room_image.paste(sprite_image, (x, y), sprite_image)
 
-    def get_layer(object: T.Dict[str, T.Any]) -> float:
-        try:
-            default = 0
-            ret = None
-            if "Layer Override" in object:
-                ret = _parse_float(object["Layer Override"])
-            if (
-                ret is None
-                and "Object" in object
-                and object["Object"] in world.objects
-            ):
-                ret = _parse_float(
-                    world.objects[object["Object"]].get("Layer")
-                )
-            return ret or default
-        except:
-            return default
 
+def _get_object_layer(world: data.World, object: T.Dict[str, T.Any]) -> float:
+    try:
+        default = 0
+        ret = None
+        if "Layer Override" in object:
+            ret = _parse_float(object["Layer Override"])
+        if (
+            ret is None
+            and "Object" in object
+            and object["Object"] in world.objects
+        ):
+            ret = _parse_float(world.objects[object["Object"]].get("Layer"))
+        return ret or default
+    except:
+        return default
+
+
+def _get_object_draws(
+    room_data: data.Room, world: data.World
+) -> T.List[render_plan.ObjectDraw]:
     objects = [
         obj
-        for key, obj in room_data.objects.items()
+        for key, obj in (room_data.objects or {}).items()
         if key != "Null Object"
         and "Object" in obj
         and "X" in obj
         and "Y" in obj
         and obj["Object"] in world.objects
-        and (whitelist is None or obj["Object"] in whitelist)
     ]
-    objects = sorted(objects, key=get_layer)
+    objects = sorted(objects, key=lambda obj: _get_object_layer(world, obj))
 
+    ret = []
     for obj in objects:
         world_obj = world.objects[obj["Object"]]
         image_name = world_obj["Image"]
-        layer = get_layer(obj)
+        layer = _get_object_layer(world, obj)
+        if layer in range(0, 7):
+            band = 0
+        elif layer in range(7, 999):
+            band = 1
+        else:
+            continue
+        scale = 1.0
         if "Scale Multiplier" in obj:
             scale = _parse_float(obj["Scale Multiplier"]) or 1
         elif "Scale Min" in world_obj:
@@ -430,104 +588,178 @@ def _render_objects(
             alpha = 255 - (_parse_float(world_obj["Transparency Max"]) or 0)
         else:
             alpha = 255
-        alpha *= opacity
         coeff = int(obj.get("RGB Coefficient", 0xFFFFFF))
         flip = bool(obj.get("Flip", False))
-        color = (*_to_rgb(coeff), alpha)
-
-        if layer not in layers:
-            continue
 
-        object_tile = _read_object_image(room_data.world.game_dir, image_name)
-        object_tile = Image.merge(
-            "RGBA",
-            [
-                ImageMath.eval(
-                    'convert(convert(image, "F") * coeff, "L")',
-                    image=band,
-                    coeff=color[i] / 255.0,
-                )
-                for i, band in enumerate(object_tile.split())
-            ],
-        )
-        object_tile = object_tile.resize(
-            (int(object_tile.width * scale), int(object_tile.height * scale))
+        width, height = _get_object_size(
+            world.game_dir, image_name, scale, angle
         )
-        if flip:
-            object_tile = object_tile.transpose(Image.FLIP_LEFT_RIGHT)
-        object_tile = object_tile.rotate(angle, expand=True)
-
         x0 = _parse_float(obj["X"]) or 0
         y0 = _parse_float(obj["Y"]) or 0
-        x1 = x0 - object_tile.width / 2
-        y1 = y0 - object_tile.height / 2
-        hx = _parse_float(world.objects[obj["Object"]].get("X Hotspot")) or 0
-        hy = _parse_float(world.objects[obj["Object"]].get("Y Hotspot")) or 0
+        x1 = x0 - width / 2
+        y1 = y0 - height / 2
+        hx = _parse_float(world_obj.get("X Hotspot")) or 0
+        hy = _parse_float(world_obj.get("Y Hotspot")) or 0
         hotspot_theta = math.atan2(hy, hx) - math.radians(angle)
         hotspot_delta = math.sqrt(hx * hx + hy * hy)
         x2 = x1 - hotspot_delta * math.cos(hotspot_theta)
         y2 = y1 - hotspot_delta * math.sin(hotspot_theta)
-        room_image.paste(object_tile, (int(x2), int(y2)), object_tile)
+
+        ret.append(
+            (
+                band,
+                obj["Object"],
+                image_name,
+                _to_rgb(coeff),
+                alpha,
+                scale,
+                flip,
+                angle,
+                int(x2),
+                int(y2),
+            )
+        )
+    return ret
 
 
-def _render_warps(
+def _render_objects(
     room_image: ImageObj,
-    room_data: data.Room,
-    outgoing_warps: WarpDict,
-    incoming_warps: WarpDict,
+    object_draws: T.List[render_plan.ObjectDraw],
+    game_dir: str,
+    opacity: float,
+    whitelist: T.Optional[T.List[str]],
+    bands: T.Container[int],
+) -> None:
+    if not opacity:
+        return
+
+    for (
+        band,
+        object_name,
+        image_name,
+        color,
+        alpha,
+        scale,
+        flip,
+        angle,
+        x,
+        y,
+    ) in object_draws:
+        if band not in bands:
+            continue
+        if whitelist is not None and object_name not in whitelist:
+            continue
+        object_tile = _create_object_image(
+            game_dir, image_name, (*color, alpha * opacity), scale, flip, angle
+        )
+        room_image.paste(object_tile, (x, y), object_tile)
+
+
+@util.memoize
+def _get_font() -> T.Any:
+    return ImageFont.truetype(FONT_NAME, FONT_SIZE)
+
+
+@util.lru_memoize("text_stamps")
+def _create_text_stamp(
+    text: str,
+    fill: Color,
+    x_fraction: float,
+    y_fraction: float,
+    overlay: bool,
+) -> T.Optional[T.Tuple[ImageObj, int, int]]:
+    font = _get_font()
+    text_width, text_height = font.getsize(text)
+    size = (text_width + FONT_SIZE * 2, text_height + FONT_SIZE * 2)
+    xy = (FONT_SIZE + x_fraction, FONT_SIZE + y_fraction)
+
+    mask = Image.new(mode="L", size=size)
+    ImageDraw.Draw(mask).text(xy, text, font=font, fill=255)
+    bbox = mask.getbbox()
+    if not bbox:
+        return None
+
+    if overlay:
+        stamp = Image.new(mode="RGBA", size=size)
+        ImageDraw.Draw(stamp).text(xy, text, font=font, fill=fill)
+    else:
+        stamp = Image.new(mode="RGBA", size=size, color=fill)
+        stamp.putalpha(mask)
+    return (stamp.crop(bbox), bbox[0] - FONT_SIZE, bbox[1] - FONT_SIZE)
+
+
+def _draw_text(
+    image: ImageObj,
+    xy: T.Tuple[float, float],
+    text: str,
+    fill: Color,
+    overlay: bool = False,
 ) -> None:
-    draw = ImageDraw.Draw(room_image)
-    font = ImageFont.truetype(FONT_NAME, FONT_SIZE)
+    x, y = xy
+    text_stamp = _create_text_stamp(
+        text, fill, x - int(x), y - int(y), overlay
+    )
+    if text_stamp:
+        stamp, dx, dy = text_stamp
+        image.paste(stamp, (int(x) + dx, int(y) + dy), stamp)
+
+
+def _get_text_draws(
+    room_pos: Coord, outgoing_warps: WarpDict, incoming_warps: WarpDict
+) -> T.List[render_plan.TextDraw]:
+    font = _get_font()
+    room_width = ROOM_WIDTH * TILE_WIDTH
+    ret: T.List[render_plan.TextDraw] = []
 
-    for i, source_pos in enumerate(incoming_warps.get(room_data.pos, [])):
+    for i, source_pos in enumerate(incoming_warps.get(room_pos, [])):
         source_x, source_y = source_pos
-        draw.text(
-            (10, 10 + FONT_SIZE * i),
-            _get_room_name(source_x, source_y) + "\N{RIGHTWARDS ARROW}",
-            font=font,
-            fill=INCOMING_WARP_FONT_COLOR,
+        ret.append(
+            (
+                10,
+                10 + FONT_SIZE * i,
+                _get_room_name(source_x, source_y) + "\N{RIGHTWARDS ARROW}",
+                INCOMING_WARP_FONT_COLOR,
+                False,
+            )
         )
 
-    for i, target_pos in enumerate(outgoing_warps.get(room_data.pos, [])):
+    for i, target_pos in enumerate(outgoing_warps.get(room_pos, [])):
         target_x, target_y = target_pos
         text = "\N{RIGHTWARDS ARROW}" + _get_room_name(target_x, target_y)
         text_width, _ = font.getsize(text)
-        draw.text(
-            (room_image.width - 10 - text_width, 10 + FONT_SIZE * i),
-            text,
-            font=font,
-            fill=OUTGOING_WARP_FONT_COLOR,
+        ret.append(
+            (
+                room_width - 10 - text_width,
+                10 + FONT_SIZE * i,
+                text,
+                OUTGOING_WARP_FONT_COLOR,
+                False,
+            )
         )
 
-
-def _render_room_name(room_image: ImageObj, room_data: data.Room) -> None:
-    overlay_image = Image.new(size=room_image.size, mode="RGBA")
-    draw = ImageDraw.Draw(overlay_image)
-    font = ImageFont.truetype(FONT_NAME, FONT_SIZE)
-    text = _get_room_name(room_data.x, room_data.y)
-    text_width, text_height = font.getsize(text)
-    draw.text(
-        ((room_image.width - text_width) / 2, 10),
-        text,
-        font=font,
-        fill=ROOM_NAME_FONT_COLOR,
+    text = _get_room_name(*room_pos)
+    text_width, _text_height = font.getsize(text)
+    ret.append(
+        ((room_width - text_width) / 2, 10, text, ROOM_NAME_FONT_COLOR, True)
     )
-    room_image.paste(overlay_image, (0, 0), overlay_image)
+    return ret
 
 
-def _render_axes(geometry: util.Geometry, map_image: ImageObj) -> None:
-    draw = ImageDraw.Draw(map_image)
-    font = ImageFont.truetype(FONT_NAME, FONT_SIZE)
+def _render_texts(
+    room_image: ImageObj, text_draws: T.List[render_plan.TextDraw]
+) -> None:
+    for x, y, text, fill, overlay in text_draws:
+        _draw_text(room_image, (x, y), text, fill, overlay)
+
+
+def _render_axis_x(geometry: util.Geometry, strip_image: ImageObj) -> None:
+    draw = ImageDraw.Draw(strip_image)
+    font = _get_font()
 
     for world_x in range(geometry.min_x, geometry.max_x + 1):
         text = _get_room_name_x(world_x)
         text_width, text_height = font.getsize(text)
-        x1 = (
-            AXIS_SIZE_X
-            + ROOM_BORDER_SIZE
-            + (world_x - geometry.min_x)
-            * (ROOM_WIDTH * TILE_WIDTH + ROOM_BORDER_SIZE)
-        )
+        x1 = _get_room_x(geometry, world_x)
         x2 = x1 + ROOM_WIDTH * TILE_WIDTH - 1
         y1 = 0
         y2 = AXIS_SIZE_Y - 1
@@ -543,49 +775,84 @@ def _render_axes(geometry: util.Geometry, map_image: ImageObj) -> None:
             fill=AXIS_FONT_COLOR,
         )
 
-    for world_y in range(geometry.min_y, geometry.max_y + 1):
-        text = _get_room_name_y(world_y)
-        text_width, text_height = font.getsize(text)
-        x1 = 0
-        x2 = AXIS_SIZE_X - 1
-        y1 = (
-            AXIS_SIZE_Y
-            + ROOM_BORDER_SIZE
-            + (world_y - geometry.min_y)
-            * (ROOM_HEIGHT * TILE_HEIGHT + ROOM_BORDER_SIZE)
-        )
-        y2 = y1 + ROOM_HEIGHT * TILE_HEIGHT - 1
+    draw.rectangle((0, 0, AXIS_SIZE_X - 1, AXIS_SIZE_Y - 1), fill=AXIS_COLOR)
 
-        draw.rectangle((x1, y1, x2, y2), fill=AXIS_COLOR)
-        draw.text(
-            (
-                x1 + (x2 - x1 - text_width) / 2,
-                y1 + (y2 - y1 - text_height) / 2,
-            ),
-            text,
-            font=font,
-        )
 
-    draw.rectangle((0, 0, AXIS_SIZE_X - 1, AXIS_SIZE_Y - 1), fill=AXIS_COLOR)
+def _create_axis_y_image(world_y: int) -> ImageObj:
+    axis_image = Image.new(
+        mode="RGB",
+        size=(AXIS_SIZE_X, ROOM_HEIGHT * TILE_HEIGHT),
+        color=AXIS_COLOR,
+    )
+    draw = ImageDraw.Draw(axis_image)
+    font = _get_font()
 
+    text = _get_room_name_y(world_y)
+    text_width, text_height = font.getsize(text)
+    x1 = 0
+    x2 = AXIS_SIZE_X - 1
+    y1 = 0
+    y2 = y1 + ROOM_HEIGHT * TILE_HEIGHT - 1
 
-def _create_map_image(geometry: util.Geometry) -> ImageObj:
+    draw.rectangle((x1, y1, x2, y2), fill=AXIS_COLOR)
+    draw.text(
+        (x1 + (x2 - x1 - text_width) / 2, y1 + (y2 - y1 - text_height) / 2),
+        text,
+        font=font,
+    )
+    return axis_image
+
+
+def _scale_span(start: int, length: int, scale: int) -> T.Tuple[int, int]:
+    return (start // scale, (start + length) // scale - start // scale)
+
+
+def _has_area(size: T.Tuple[int, int]) -> bool:
+    return size[0] > 0 and size[1] > 0
+
+
+def _scale_image(image: ImageObj, size: T.Tuple[int, int]) -> ImageObj:
+    if image.size == size:
+        return image
+    if not _has_area(size):
+        return Image.new(mode=image.mode, size=size)
+    return image.resize(size, Image.ANTIALIAS)
+
+
+def get_map_size(geometry: util.Geometry, scale: int = 1) -> T.Tuple[int, int]:
     width = geometry.max_x + 1 - geometry.min_x
     height = geometry.max_y + 1 - geometry.min_y
-    return Image.new(
-        mode="RGB",
-        size=(
+    return (
+        (
             AXIS_SIZE_X
             + ROOM_BORDER_SIZE
-            + width * ((ROOM_WIDTH * TILE_WIDTH) + ROOM_BORDER_SIZE),
+            + width * ((ROOM_WIDTH * TILE_WIDTH) + ROOM_BORDER_SIZE)
+        )
+        // scale,
+        (
             AXIS_SIZE_Y
             + ROOM_BORDER_SIZE
-            + height * ((ROOM_HEIGHT * TILE_HEIGHT) + ROOM_BORDER_SIZE),
-        ),
+            + height * ((ROOM_HEIGHT * TILE_HEIGHT) + ROOM_BORDER_SIZE)
+        )
+        // scale,
+    )
+
+
+def _create_map_image(geometry: util.Geometry, scale: int) -> ImageObj:
+    return Image.new(
+        mode="RGB",
+        size=get_map_size(geometry, scale),
         color=ROOM_BORDER_COLOR,
     )
 
 
+def _create_strip_image(
+    geometry: util.Geometry, scale: int, height: int
+) -> ImageObj:
+    width, _ = get_map_size(geometry, scale)
+    return Image.new(mode="RGB", size=(width, height), color=ROOM_BORDER_COLOR)
+
+
 def _create_room_image() -> ImageObj:
     return Image.new(
         mode="RGB",
@@ -594,113 +861,703 @@ def _create_room_image() -> ImageObj:
     )
 
 
-def _get_warp_data(world: data.World) -> T.Tuple[WarpDict, WarpDict]:
-    regex = r"(?:twilight_entrypoint|room_set)\((\d+),\s*(\d+)\)"
-    outgoing_warps: WarpDict = {}
-    incoming_warps: WarpDict = {}
-    for world_x, world_y in util.range2d(
-        0, 0, world.width + 1, world.height + 1
-    ):
-        for match in re.findall(regex, world[world_x, world_y].script or ""):
-            target_x = int(match[0])
-            target_y = int(match[1])
+def _collect_assets(
+    world: data.World,
+    positions: T.Iterable[Coord],
+    plans: T.Dict[Coord, render_plan.RoomPlan],
+    objects_opacity: float,
+    objects_whitelist: T.List[str],
+) -> Assets:
+    world_objects = world.objects or {}
+    tile_set_names: T.Set[str] = set()
+    object_names: T.Set[str] = set()
+    sprite_keys: T.Set[T.Tuple[int, int]] = set()
+    for room_pos in positions:
+        plan = plans.get(room_pos)
+        if plan is not None:
+            tile_set_names.update(draw[2] for draw in plan.tiles)
+            object_names.update(
+                draw[2]
+                for draw in plan.objects
+                if objects_opacity or draw[1] in objects_whitelist
+            )
+            sprite_keys.update(
+                (draw[3], draw[4])
+                for draw in plan.sprites
+                if isinstance(draw[3], int)
+            )
+            continue
+        room_data = world[room_pos]
+        if room_data.tiles:
+            general = room_data.tiles.get("General", {})
+            for i in range(3):
+                if "Tileset %d" % i in general:
+                    tile_set_names.add(general["Tileset %d" % i])
+        for obj in (room_data.objects or {}).values():
+            object_name = obj.get("Object")
+            if not objects_opacity and object_name not in objects_whitelist:
+                continue
+            world_obj = world_objects.get(object_name)
+            if world_obj and "Image" in world_obj:
+                object_names.add(world_obj["Image"])
+        for sprite in (room_data.sprites or {}).values():
+            definition = SPRITE_DEFINITIONS.get(sprite.get("Sprite"))
+            if definition and isinstance(definition[0], int):
+                sprite_keys.add((definition[0], definition[4]))
+    return (sorted(tile_set_names), sorted(object_names), sorted(sprite_keys))
+
 
-            if not (world_x, world_y) in outgoing_warps:
-                outgoing_warps[world_x, world_y] = []
-            outgoing_warps[world_x, world_y].append((target_x, target_y))
+def _collect_unknown_sprites(
+    world: data.World,
+    positions: T.Iterable[Coord],
+    plans: T.Dict[Coord, render_plan.RoomPlan],
+) -> T.Set[str]:
+    names: T.Set[str] = set()
+    for room_pos in positions:
+        plan = plans.get(room_pos)
+        if plan is not None:
+            names.update(plan.unknown_sprites)
+        else:
+            names.update(_get_unknown_sprites(world[room_pos]))
+    return names
+
+
+def _report_unknown_sprites(names: T.Set[str]) -> None:
+    for name in sorted(names):
+        print("Skipped sprite %s" % name, file=sys.stderr)
+
+
+_room_templates = util.register_cache(
+    "room_templates", util.LRUCache(max_bytes=util.DEFAULT_CACHE_MAX_BYTES)
+)
+_room_plans = util.register_cache(
+    "plans",
+    util.LRUCache(
+        max_bytes=util.DEFAULT_CACHE_MAX_BYTES,
+        get_size=render_plan.get_plan_size,
+    ),
+)
+
+
+class _RoomRenderer:
+    def __init__(
+        self,
+        world: data.World,
+        sprites: data.SpriteArchive,
+        backgrounds_opacity: float,
+        objects_opacity: float,
+        objects_whitelist: T.List[str],
+        tiles_opacity: float,
+        geometry: util.Geometry,
+        scale: int = 1,
+        room_cache: T.Optional[render_cache.RoomCache] = None,
+        plan_cache: T.Optional[render_plan.PlanCache] = None,
+    ) -> None:
+        self.world = world
+        self.sprites = sprites
+        self.backgrounds_opacity = backgrounds_opacity
+        self.objects_opacity = objects_opacity
+        self.objects_whitelist = objects_whitelist
+        self.tiles_opacity = tiles_opacity
+        self.geometry = geometry
+        self.scale = scale
+        self.outgoing_warps = world.outgoing_warps
+        self.incoming_warps = world.incoming_warps
+        self.room_cache = room_cache
+        self.plan_cache = plan_cache
+        self.assets_stamp = (
+            render_cache.get_assets_stamp(world.game_dir)
+            if room_cache or plan_cache
+            else ""
+        )
 
-            if not (target_x, target_y) in incoming_warps:
-                incoming_warps[target_x, target_y] = []
-            incoming_warps[target_x, target_y].append((world_x, world_y))
-    return outgoing_warps, incoming_warps
+    def prefetch(
+        self, assets: Assets, threads: int
+    ) -> T.Optional[concurrent.futures.ThreadPoolExecutor]:
+        if threads <= 0:
+            return None
+        game_dir = self.world.game_dir
+        tile_set_names, object_names, sprite_keys = assets
+        executor = concurrent.futures.ThreadPoolExecutor(threads)
+        for name in tile_set_names:
+            executor.submit(
+                _read_dark_tile_set_image, game_dir, name, self.tiles_opacity
+            )
+        for name in object_names:
+            executor.submit(_read_object_image, game_dir, name)
+        for sprite_id, rotation in sprite_keys:
+            if sprite_id in self.sprites:
+                executor.submit(self.sprites.read_image, sprite_id, rotation)
+        return executor
+
+    def _get_cache_key(self, room_pos: Coord) -> str:
+        world_x, world_y = room_pos
+        return self._get_room_digest(
+            room_pos,
+            (
+                ROOM_CACHE_VERSION,
+                self.backgrounds_opacity,
+                self.objects_opacity,
+                self.objects_whitelist,
+                self.tiles_opacity,
+                self.scale,
+                self.get_room_size(room_pos),
+                _get_room_x(self.geometry, world_x) % self.scale,
+                _get_room_y(self.geometry, world_y) % self.scale,
+            ),
+        )
 
+    def _get_plan_key(self, room_pos: Coord) -> str:
+        return self._get_room_digest(room_pos, (render_plan.PLAN_VERSION,))
 
-def _report_unknown_sprites(
-    known_names: T.Set[str], all_names: T.Set[str]
+    def _get_room_digest(self, room_pos: Coord, options: T.Any) -> str:
+        digest = hashlib.sha1(
+            repr(
+                (
+                    options,
+                    self.assets_stamp,
+                    room_pos,
+                    self.outgoing_warps.get(room_pos, []),
+                    self.incoming_warps.get(room_pos, []),
+                )
+            ).encode("utf-8")
+        )
+        room_data = self.world[room_pos]
+        for name, chunk in sorted(room_data.chunks.items()):
+            digest.update(("\n%s %d\n" % (name, chunk.size)).encode("utf-8"))
+            digest.update(self.world.read_chunk(chunk))
+        return digest.hexdigest()
+
+    def get_room_size(self, room_pos: Coord) -> T.Tuple[int, int]:
+        world_x, world_y = room_pos
+        _, width = _scale_span(
+            _get_room_x(self.geometry, world_x),
+            ROOM_WIDTH * TILE_WIDTH,
+            self.scale,
+        )
+        _, height = _scale_span(
+            _get_room_y(self.geometry, world_y),
+            ROOM_HEIGHT * TILE_HEIGHT,
+            self.scale,
+        )
+        return (width, height)
+
+    def render(self, room_pos: Coord) -> ImageObj:
+        room_size = self.get_room_size(room_pos)
+        if not _has_area(room_size):
+            return Image.new(mode="RGB", size=room_size)
+        with profiling.measure_room(room_pos):
+            if not self.room_cache:
+                return self._render_scaled(room_pos)
+            with profiling.measure("room cache load"):
+                key = self._get_cache_key(room_pos)
+                room_image = self.room_cache.load(key)
+            if room_image is None:
+                room_image = self._render_scaled(room_pos)
+                with profiling.measure("room cache store"):
+                    self.room_cache.store(key, room_image)
+            return room_image
+
+    def _render_scaled(self, room_pos: Coord) -> ImageObj:
+        room_image = self._render(room_pos)
+        with profiling.measure("_scale_image"):
+            return _scale_image(room_image, self.get_room_size(room_pos))
+
+    def load_plans(
+        self, positions: T.Iterable[Coord]
+    ) -> T.Dict[Coord, render_plan.RoomPlan]:
+        plans: T.Dict[Coord, render_plan.RoomPlan] = {}
+        if not self.plan_cache:
+            return plans
+        for room_pos in positions:
+            key = self._get_plan_key(room_pos)
+            plan = self.plan_cache.load(key)
+            if plan is not None:
+                plans[room_pos] = plan
+                _room_plans.put(key, plan)
+        return plans
+
+    def get_plan(self, room_pos: Coord) -> render_plan.RoomPlan:
+        if not self.plan_cache:
+            return self._compile(room_pos)
+        with profiling.measure("plan cache load"):
+            key = self._get_plan_key(room_pos)
+            plan = _room_plans.get(key)
+            if plan is None:
+                plan = self.plan_cache.load(key)
+        if plan is None:
+            plan = self._compile(room_pos)
+            with profiling.measure("plan cache store"):
+                self.plan_cache.store(key, plan)
+        return plan
+
+    def _compile(self, room_pos: Coord) -> render_plan.RoomPlan:
+        room_data = self.world[room_pos]
+        with profiling.measure("compile"):
+            return render_plan.RoomPlan(
+                _get_background_colors(room_data),
+                _get_tile_draws(room_data),
+                _get_object_draws(room_data, self.world),
+                _get_sprite_draws(room_data),
+                _get_text_draws(
+                    room_pos, self.outgoing_warps, self.incoming_warps
+                ),
+                _get_unknown_sprites(room_data),
+            )
+
+    def _get_template_key(self, room_pos: Coord) -> bytes:
+        digest = hashlib.sha1(
+            repr(
+                (
+                    self.backgrounds_opacity,
+                    self.objects_opacity,
+                    self.objects_whitelist,
+                    self.tiles_opacity,
+                )
+            ).encode("utf-8")
+        )
+        room_data = self.world[room_pos]
+        for name in _RENDER_CHUNK_NAMES:
+            chunk = room_data.chunks.get(name)
+            if chunk:
+                digest.update(("\n%s %d\n" % (name, chunk.size)).encode())
+                digest.update(self.world.read_chunk(chunk))
+        return digest.digest()
+
+    def _render(self, room_pos: Coord) -> ImageObj:
+        key = self._get_template_key(room_pos)
+        template = _room_templates.get(key)
+        if template is None:
+            plan = self.get_plan(room_pos)
+            template = self._replay_template(plan)
+            _room_templates.put(key, template)
+            text_draws = plan.texts
+        else:
+            text_draws = _get_text_draws(
+                room_pos, self.outgoing_warps, self.incoming_warps
+            )
+
+        room_image = template.copy()
+        with profiling.measure("_render_texts"):
+            _render_texts(room_image, text_draws)
+        return room_image
+
+    def _replay_template(self, plan: render_plan.RoomPlan) -> ImageObj:
+        game_dir = self.world.game_dir
+        sprites = self.sprites
+        room_image = _create_room_image()
+
+        # background
+        with profiling.measure("_render_background"):
+            _render_background(
+                room_image, plan.background, self.backgrounds_opacity
+            )
+
+        # stuff under blocks
+        with profiling.measure("_render_objects"):
+            _render_objects(
+                room_image,
+                plan.objects,
+                game_dir,
+                self.objects_opacity,
+                None,
+                (0,),
+            )
+        with profiling.measure("_render_sprites"):
+            _render_sprites(room_image, plan.sprites, sprites, 0)
+
+        # blocks
+        with profiling.measure("_render_tiles"):
+            _render_tiles(room_image, plan.tiles, game_dir, self.tiles_opacity)
+
+        # stuff above blocks
+        with profiling.measure("_render_objects"):
+            _render_objects(
+                room_image,
+                plan.objects,
+                game_dir,
+                self.objects_opacity,
+                None,
+                (1,),
+            )
+        with profiling.measure("_render_objects"):
+            _render_objects(
+                room_image,
+                plan.objects,
+                game_dir,
+                1.0,
+                self.objects_whitelist,
+                (0, 1),
+            )
+        with profiling.measure("_render_sprites"):
+            _render_sprites(room_image, plan.sprites, sprites, 1)
+
+        return room_image
+
+
+_worker_room_renderer: T.Optional[_RoomRenderer] = None
+_worker_prefetch: T.Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+
+def _init_worker(
+    room_renderer: _RoomRenderer,
+    cache_budget: T.Dict[str, T.Optional[int]],
+    profile_rooms: T.Optional[int],
+    assets: Assets,
+    prefetch_threads: int,
 ) -> None:
-    for name in sorted(all_names):
-        if name not in known_names:
-            print("Skipped sprite %s" % name, file=sys.stderr)
+    global _worker_room_renderer, _worker_prefetch
+    _worker_room_renderer = room_renderer
+    util.configure_caches(**cache_budget)
+    if profile_rooms is not None:
+        profiling.enable(profile_rooms)
+    _worker_prefetch = room_renderer.prefetch(assets, prefetch_threads)
+
+
+def _render_room_in_worker(room_pos: Coord) -> T.Tuple[Coord, ImageObj, T.Any]:
+    assert _worker_room_renderer
+    room_image = _worker_room_renderer.render(room_pos)
+    return (
+        room_pos,
+        room_image if _has_area(room_image.size) else None,
+        (
+            os.getpid(),
+            util.get_local_cache_stats(),
+            profiling.get_local_snapshot(),
+        ),
+    )
 
 
-def render_world(
+def _render_rooms(
+    room_renderer: _RoomRenderer,
+    rows: T.List[T.List[Coord]],
+    jobs: int,
+    assets: Assets,
+    prefetch_threads: int,
+) -> T.Iterable[T.Tuple[Coord, ImageObj]]:
+    if jobs <= 1:
+        executor = room_renderer.prefetch(assets, prefetch_threads)
+        try:
+            for row in rows:
+                for room_pos in row:
+                    yield room_pos, room_renderer.render(room_pos)
+        finally:
+            if executor:
+                executor.shutdown()
+        return
+
+    with multiprocessing.Pool(
+        jobs,
+        initializer=_init_worker,
+        initargs=(
+            room_renderer,
+            util.get_cache_budget(),
+            profiling.get_max_rooms(),
+            assets,
+            prefetch_threads,
+        ),
+    ) as pool:
+        pending: T.Deque[T.Any] = collections.deque()
+        positions = (room_pos for row in rows for room_pos in row)
+        while True:
+            for room_pos in positions:
+                pending.append(
+                    pool.apply_async(_render_room_in_worker, (room_pos,))
+                )
+                if len(pending) >= jobs * RENDER_LOOKAHEAD:
+                    break
+            if not pending:
+                break
+            room_pos, room_image, stats = pending.popleft().get()
+            if room_image is None:
+                room_image = Image.new(
+                    mode="RGB", size=room_renderer.get_room_size(room_pos)
+                )
+            pid, cache_stats, profile_snapshot = stats
+            util.record_cache_stats(pid, cache_stats)
+            profiling.record_snapshot(pid, profile_snapshot)
+            yield room_pos, room_image
+
+
+def _get_room_x(geometry: util.Geometry, world_x: int) -> int:
+    return (
+        AXIS_SIZE_X
+        + ROOM_BORDER_SIZE
+        + (world_x - geometry.min_x)
+        * (ROOM_WIDTH * TILE_WIDTH + ROOM_BORDER_SIZE)
+    )
+
+
+def _get_room_y(geometry: util.Geometry, world_y: int) -> int:
+    return (
+        AXIS_SIZE_Y
+        + ROOM_BORDER_SIZE
+        + (world_y - geometry.min_y)
+        * (ROOM_HEIGHT * TILE_HEIGHT + ROOM_BORDER_SIZE)
+    )
+
+
+def get_world_geometry(
+    world: data.World, geometry: T.Optional[util.Geometry]
+) -> util.Geometry:
+    if not geometry:
+        geometry = util.Geometry(0, 0, world.width - 1, world.height - 1)
+    return geometry
+
+
+def _create_axis_strip_image(geometry: util.Geometry, scale: int) -> ImageObj:
+    strip_image = _create_strip_image(
+        geometry, 1, AXIS_SIZE_Y + ROOM_BORDER_SIZE
+    )
+    _render_axis_x(geometry, strip_image)
+    _, height = _scale_span(0, strip_image.height, scale)
+    width, _ = get_map_size(geometry, scale)
+    return _scale_image(strip_image, (width, height))
+
+
+def _create_axis_y_strip_image(
+    geometry: util.Geometry, scale: int, world_y: int
+) -> ImageObj:
+    room_y = _get_room_y(geometry, world_y)
+    _, axis_width = _scale_span(0, AXIS_SIZE_X, scale)
+    _, axis_height = _scale_span(room_y, ROOM_HEIGHT * TILE_HEIGHT, scale)
+    return _scale_image(
+        _create_axis_y_image(world_y), (axis_width, axis_height)
+    )
+
+
+def _create_row_strip_image(
+    geometry: util.Geometry, scale: int, world_y: int
+) -> ImageObj:
+    _, strip_height = _scale_span(
+        _get_room_y(geometry, world_y),
+        ROOM_HEIGHT * TILE_HEIGHT + ROOM_BORDER_SIZE,
+        scale,
+    )
+    strip_image = _create_strip_image(geometry, scale, strip_height)
+    strip_image.paste(
+        _create_axis_y_strip_image(geometry, scale, world_y), (0, 0)
+    )
+    return strip_image
+
+
+@util.lru_memoize("axis_strips")
+def _get_axis_strip_image(geometry: util.Geometry, scale: int) -> ImageObj:
+    return _create_axis_strip_image(geometry, scale)
+
+
+@util.lru_memoize("axis_rows")
+def _get_axis_y_strip_image(
+    geometry: util.Geometry, scale: int, world_y: int
+) -> ImageObj:
+    return _create_axis_y_strip_image(geometry, scale, world_y)
+
+
+def create_room_renderer(
     world: data.World,
     sprites: data.SpriteArchive,
     backgrounds_opacity: float,
     objects_opacity: float,
     objects_whitelist: T.List[str],
     tiles_opacity: float,
-    geometry: T.Optional[util.Geometry],
-) -> Image:
-    if not geometry:
-        geometry = util.Geometry(0, 0, world.width - 1, world.height - 1)
+    geometry: util.Geometry,
+    scale: int = 1,
+    room_cache: T.Optional[render_cache.RoomCache] = None,
+    plan_cache: T.Optional[render_plan.PlanCache] = None,
+) -> _RoomRenderer:
+    return _RoomRenderer(
+        world,
+        sprites,
+        backgrounds_opacity,
+        objects_opacity,
+        objects_whitelist,
+        tiles_opacity,
+        geometry,
+        scale,
+        room_cache,
+        plan_cache,
+    )
 
-    map_image = _create_map_image(geometry)
-    outgoing_warps, incoming_warps = _get_warp_data(world)
-    for world_x, world_y in util.progress(
-        util.range2d(
-            geometry.min_x,
-            geometry.min_y,
-            geometry.max_x + 1,
-            geometry.max_y + 1,
+
+def _prepare_rooms(
+    room_renderer: _RoomRenderer, positions: T.List[Coord]
+) -> T.Tuple[Assets, T.Set[str]]:
+    world = room_renderer.world
+    with profiling.measure("plan cache load"):
+        plans = room_renderer.load_plans(positions)
+    with profiling.measure("preload"):
+        world.preload(
+            (room_pos for room_pos in positions if room_pos not in plans),
+            _RENDER_CHUNK_NAMES,
+        )
+    with profiling.measure("collect assets"):
+        return (
+            _collect_assets(
+                world,
+                positions,
+                plans,
+                room_renderer.objects_opacity,
+                room_renderer.objects_whitelist,
+            ),
+            _collect_unknown_sprites(world, positions, plans),
         )
-    ):
-        room_image = _create_room_image()
-        room_data = world[world_x, world_y]
 
-        # background
-        _render_backgrounds(room_image, room_data, backgrounds_opacity)
 
-        # stuff under blocks
-        _render_objects(
-            room_image, room_data, world, objects_opacity, None, range(0, 7)
-        )
-        _render_sprites(room_image, room_data, sprites, 0)
+def warm_up(
+    room_renderer: _RoomRenderer,
+    positions: T.List[Coord],
+    prefetch_threads: int,
+) -> None:
+    assets, _ = _prepare_rooms(room_renderer, positions)
+    with profiling.measure("prefetch"):
+        executor = room_renderer.prefetch(assets, prefetch_threads)
+        if executor:
+            executor.shutdown()
 
-        # blocks
-        _render_tiles(room_image, room_data, tiles_opacity)
 
-        # stuff above blocks
-        _render_objects(
-            room_image, room_data, world, objects_opacity, None, range(7, 999)
-        )
-        _render_objects(
-            room_image, room_data, world, 1.0, objects_whitelist, range(999)
-        )
-        _render_sprites(room_image, room_data, sprites, 1)
+def render_map_region(
+    room_renderer: _RoomRenderer,
+    box: T.Tuple[int, int, int, int],
+    render_room: T.Optional[T.Callable[[Coord], ImageObj]] = None,
+) -> ImageObj:
+    geometry = room_renderer.geometry
+    scale = room_renderer.scale
+    render_room = render_room or room_renderer.render
+    x1, y1, x2, y2 = box
+    region_image = Image.new(
+        mode="RGB", size=(x2 - x1, y2 - y1), color=ROOM_BORDER_COLOR
+    )
 
-        # mapper stuff
-        _render_warps(room_image, room_data, outgoing_warps, incoming_warps)
-        _render_room_name(room_image, room_data)
+    axis_strip_image = _get_axis_strip_image(geometry, scale)
+    if y1 < axis_strip_image.height:
+        region_image.paste(axis_strip_image, (-x1, -y1))
 
-        # put the room onto the map
-        map_image.paste(
-            room_image,
-            (
-                AXIS_SIZE_X
-                + ROOM_BORDER_SIZE
-                + (world_x - geometry.min_x)
-                * (room_image.width + ROOM_BORDER_SIZE),
-                AXIS_SIZE_Y
-                + ROOM_BORDER_SIZE
-                + (world_y - geometry.min_y)
-                * (room_image.height + ROOM_BORDER_SIZE),
-            ),
+    _, axis_width = _scale_span(0, AXIS_SIZE_X, scale)
+    for world_y in range(geometry.min_y, geometry.max_y + 1):
+        room_y, strip_height = _scale_span(
+            _get_room_y(geometry, world_y),
+            ROOM_HEIGHT * TILE_HEIGHT + ROOM_BORDER_SIZE,
+            scale,
         )
+        if room_y >= y2 or room_y + strip_height <= y1:
+            continue
+        if x1 < axis_width:
+            region_image.paste(
+                _get_axis_y_strip_image(geometry, scale, world_y),
+                (-x1, room_y - y1),
+            )
+        for world_x in range(geometry.min_x, geometry.max_x + 1):
+            room_x, room_width = _scale_span(
+                _get_room_x(geometry, world_x),
+                ROOM_WIDTH * TILE_WIDTH,
+                scale,
+            )
+            if room_x >= x2 or room_x + room_width <= x1:
+                continue
+            region_image.paste(
+                render_room((world_x, world_y)), (room_x - x1, room_y - y1)
+            )
+    return region_image
 
-    _render_axes(geometry, map_image)
 
-    _report_unknown_sprites(
-        set(SPRITE_DEFINITIONS.keys()),
-        set(
-            [
-                sprite["Sprite"]
-                for room in world
-                if room.sprites
-                for sprite in room.sprites.values()
-                if "X" in sprite and "Y" in sprite and "Sprite" in sprite
-            ]
-        ),
+def render_world_strips(
+    world: data.World,
+    sprites: data.SpriteArchive,
+    backgrounds_opacity: float,
+    objects_opacity: float,
+    objects_whitelist: T.List[str],
+    tiles_opacity: float,
+    geometry: T.Optional[util.Geometry],
+    scale: int = 1,
+    jobs: int = 1,
+    room_cache: T.Optional[render_cache.RoomCache] = None,
+    plan_cache: T.Optional[render_plan.PlanCache] = None,
+    prefetch_threads: int = 4,
+) -> T.Iterable[ImageObj]:
+    geometry = get_world_geometry(world, geometry)
+
+    rows = [
+        [
+            (world_x, world_y)
+            for world_x in range(geometry.min_x, geometry.max_x + 1)
+        ]
+        for world_y in range(geometry.min_y, geometry.max_y + 1)
+    ]
+    room_renderer = _RoomRenderer(
+        world,
+        sprites,
+        backgrounds_opacity,
+        objects_opacity,
+        objects_whitelist,
+        tiles_opacity,
+        geometry,
+        scale,
+        room_cache,
+        plan_cache,
+    )
+    assets, unknown_sprites = _prepare_rooms(
+        room_renderer, [room_pos for row in rows for room_pos in row]
     )
 
+    with profiling.measure("axes"):
+        axis_strip_image = _create_axis_strip_image(geometry, scale)
+    yield axis_strip_image
+
+    strip_image = None
+    strip_rooms = 0
+    for room_pos, room_image in util.progress(
+        _render_rooms(room_renderer, rows, jobs, assets, prefetch_threads),
+        sum(map(len, rows)),
+    ):
+        world_x, world_y = room_pos
+        if strip_image is None:
+            with profiling.measure("axes"):
+                strip_image = _create_row_strip_image(geometry, scale, world_y)
+        with profiling.measure("paste"):
+            strip_image.paste(
+                room_image, (_get_room_x(geometry, world_x) // scale, 0)
+            )
+        strip_rooms += 1
+        if strip_rooms == len(rows[world_y - geometry.min_y]):
+            yield strip_image
+            strip_image = None
+            strip_rooms = 0
+
+    _report_unknown_sprites(unknown_sprites)
+
+
+def render_world(
+    world: data.World,
+    sprites: data.SpriteArchive,
+    backgrounds_opacity: float,
+    objects_opacity: float,
+    objects_whitelist: T.List[str],
+    tiles_opacity: float,
+    geometry: T.Optional[util.Geometry],
+    scale: int = 1,
+    jobs: int = 1,
+    room_cache: T.Optional[render_cache.RoomCache] = None,
+    plan_cache: T.Optional[render_plan.PlanCache] = None,
+    prefetch_threads: int = 4,
+) -> Image:
+    geometry = get_world_geometry(world, geometry)
+    map_image = _create_map_image(geometry, scale)
+    y = 0
+    for strip_image in render_world_strips(
+        world,
+        sprites,
+        backgrounds_opacity,
+        objects_opacity,
+        objects_whitelist,
+        tiles_opacity,
+        geometry,
+        scale,
+        jobs,
+        room_cache,
+        plan_cache,
+        prefetch_threads,
+    ):
+        with profiling.measure("paste"):
+            map_image.paste(strip_image, (0, y))
+        y += strip_image.height
     return map_image
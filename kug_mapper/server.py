@@ -0,0 +1,365 @@
+import concurrent.futures
+import io
+import json
+import re
+import socketserver
+import sys
+import threading
+import typing as T
+import urllib.parse
+from http import server as http_server
+
+from PIL import Image
+
+from kug_mapper import (
+    data,
+    profiling,
+    pyramid,
+    render_cache,
+    render_plan,
+    renderer,
+    util,
+)
+
+ImageObj = T.Any
+Coord = T.Tuple[int, int]
+Options = T.Tuple[float, float, float, int]
+
+DEFAULT_RESULTS_MAX_BYTES = 64 << 20
+MAX_RENDERERS = 16
+MAX_ROOM_SCALE = min(
+    renderer.ROOM_WIDTH * renderer.TILE_WIDTH,
+    renderer.ROOM_HEIGHT * renderer.TILE_HEIGHT,
+)
+MAX_TILE_SCALE = min(
+    renderer.AXIS_SIZE_X, renderer.AXIS_SIZE_Y + renderer.ROOM_BORDER_SIZE
+)
+
+_ROOM_PATH_REGEX = re.compile(r"^/rooms/(\d+)/(\d+)\.png$")
+_TILE_PATH_REGEX = re.compile(r"^/tiles/(\d+)/(\d+)/(\d+)\.png$")
+_METADATA_PATH = "/metadata.json"
+
+
+class RequestError(Exception):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+def _encode_png(image: ImageObj) -> bytes:
+    handle = io.BytesIO()
+    image.save(handle, format="PNG")
+    return handle.getvalue()
+
+
+def _parse_opacity(value: str) -> float:
+    opacity = float(value)
+    if not 0.0 <= opacity <= 1.0:
+        raise ValueError("opacity out of range")
+    return opacity
+
+
+def _parse_scale(value: str) -> int:
+    scale = int(value)
+    if not 1 <= scale <= MAX_ROOM_SCALE:
+        raise ValueError("scale out of range")
+    return scale
+
+
+class MapServer:
+    def __init__(
+        self,
+        world: data.World,
+        sprites: data.SpriteArchive,
+        objects_whitelist: T.List[str],
+        geometry: T.Optional[util.Geometry],
+        options: Options,
+        jobs: int = 1,
+        tile_size: int = 256,
+        room_cache: T.Optional[render_cache.RoomCache] = None,
+        plan_cache: T.Optional[render_plan.PlanCache] = None,
+    ) -> None:
+        self.world = world
+        self.sprites = sprites
+        self.objects_whitelist = objects_whitelist
+        self.geometry = renderer.get_world_geometry(world, geometry)
+        self.options = options
+        self.tile_size = tile_size
+        self.room_cache = room_cache
+        self.plan_cache = plan_cache
+        self.results = util.register_cache(
+            "served",
+            util.LRUCache(max_bytes=DEFAULT_RESULTS_MAX_BYTES, get_size=len),
+        )
+        self.rooms = util.register_cache(
+            "served_rooms",
+            util.LRUCache(max_bytes=util.DEFAULT_CACHE_MAX_BYTES),
+        )
+        self.tiles = util.register_cache(
+            "served_tiles",
+            util.LRUCache(max_bytes=util.DEFAULT_CACHE_MAX_BYTES),
+        )
+        self._executor = concurrent.futures.ThreadPoolExecutor(jobs)
+        self._renderers = util.LRUCache(max_entries=MAX_RENDERERS)
+        self._pending: T.Dict[T.Any, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+
+    def warm_up(self, prefetch_threads: int) -> None:
+        positions = list(
+            util.range2d(
+                self.geometry.min_x,
+                self.geometry.min_y,
+                self.geometry.max_x + 1,
+                self.geometry.max_y + 1,
+            )
+        )
+        renderer.warm_up(
+            self._get_room_renderer(self.options), positions, prefetch_threads
+        )
+
+    def close(self) -> None:
+        self._executor.shutdown()
+
+    def _get_room_renderer(self, options: Options) -> renderer._RoomRenderer:
+        with self._lock:
+            room_renderer = self._renderers.get(options)
+            if room_renderer is None:
+                backgrounds_opacity, objects_opacity, tiles_opacity, scale = (
+                    options
+                )
+                room_renderer = renderer.create_room_renderer(
+                    self.world,
+                    self.sprites,
+                    backgrounds_opacity,
+                    objects_opacity,
+                    self.objects_whitelist,
+                    tiles_opacity,
+                    self.geometry,
+                    scale,
+                    self.room_cache,
+                    self.plan_cache,
+                )
+                self._renderers.put(options, room_renderer)
+            return room_renderer
+
+    def _parse_options(self, query: T.Dict[str, T.List[str]]) -> Options:
+        backgrounds_opacity, objects_opacity, tiles_opacity, scale = (
+            self.options
+        )
+        try:
+            if "backgrounds" in query:
+                backgrounds_opacity = _parse_opacity(query["backgrounds"][-1])
+            if "objects" in query:
+                objects_opacity = _parse_opacity(query["objects"][-1])
+            if "tiles" in query:
+                tiles_opacity = _parse_opacity(query["tiles"][-1])
+            if "scale" in query:
+                scale = _parse_scale(query["scale"][-1])
+        except ValueError as ex:
+            raise RequestError(400, str(ex))
+        return (backgrounds_opacity, objects_opacity, tiles_opacity, scale)
+
+    def handle(self, path: str) -> T.Tuple[str, bytes]:
+        url = urllib.parse.urlsplit(path)
+        options = self._parse_options(urllib.parse.parse_qs(url.query))
+
+        if url.path == _METADATA_PATH:
+            return (
+                "application/json",
+                json.dumps(self.get_metadata(options[3])).encode("utf-8"),
+            )
+
+        match = _ROOM_PATH_REGEX.match(url.path)
+        if match:
+            room_pos = (int(match.group(1)), int(match.group(2)))
+            return "image/png", self.get_room(options, room_pos)
+
+        match = _TILE_PATH_REGEX.match(url.path)
+        if match:
+            zoom, tile_x, tile_y = map(int, match.groups())
+            return "image/png", self.get_tile(options, zoom, tile_x, tile_y)
+
+        raise RequestError(404, "Not found")
+
+    def get_metadata(self, scale: int) -> T.Dict[str, T.Any]:
+        width, height = renderer.get_map_size(self.geometry, scale)
+        return {
+            "width": width,
+            "height": height,
+            "tile_size": self.tile_size,
+            "min_zoom": 0,
+            "max_zoom": pyramid.get_max_zoom(width, height, self.tile_size),
+            "scale": scale,
+            "geometry": {
+                "min_x": self.geometry.min_x,
+                "min_y": self.geometry.min_y,
+                "max_x": self.geometry.max_x,
+                "max_y": self.geometry.max_y,
+            },
+        }
+
+    def get_room(self, options: Options, room_pos: Coord) -> bytes:
+        world_x, world_y = room_pos
+        if not (
+            self.geometry.min_x <= world_x <= self.geometry.max_x
+            and self.geometry.min_y <= world_y <= self.geometry.max_y
+        ):
+            raise RequestError(404, "Room outside of the map")
+        return self._get_result(
+            ("room", options, room_pos),
+            lambda: _encode_png(self._render_room(options, room_pos)),
+        )
+
+    def get_tile(
+        self, options: Options, zoom: int, tile_x: int, tile_y: int
+    ) -> bytes:
+        if options[3] > MAX_TILE_SCALE:
+            raise RequestError(400, "scale out of range for tiles")
+        width, height = renderer.get_map_size(self.geometry, options[3])
+        max_zoom = pyramid.get_max_zoom(width, height, self.tile_size)
+        if zoom > max_zoom:
+            raise RequestError(404, "Zoom level out of range")
+        if not self._has_tile(options, max_zoom, zoom, tile_x, tile_y):
+            raise RequestError(404, "Tile outside of the map")
+        return self._get_result(
+            ("tile", options, zoom, tile_x, tile_y),
+            lambda: _encode_png(
+                self._render_tile(options, max_zoom, zoom, tile_x, tile_y)
+            ),
+        )
+
+    def _has_tile(
+        self,
+        options: Options,
+        max_zoom: int,
+        zoom: int,
+        tile_x: int,
+        tile_y: int,
+    ) -> bool:
+        width, height = renderer.get_map_size(self.geometry, options[3])
+        factor = 1 << (max_zoom - zoom)
+        return (
+            tile_x * self.tile_size * factor < width
+            and tile_y * self.tile_size * factor < height
+        )
+
+    def _render_tile(
+        self,
+        options: Options,
+        max_zoom: int,
+        zoom: int,
+        tile_x: int,
+        tile_y: int,
+    ) -> ImageObj:
+        key = (options, zoom, tile_x, tile_y)
+        tile_image = self.tiles.get(key)
+        if tile_image is not None:
+            return tile_image
+
+        tile_size = self.tile_size
+        if zoom == max_zoom:
+            tile_image = renderer.render_map_region(
+                self._get_room_renderer(options),
+                (
+                    tile_x * tile_size,
+                    tile_y * tile_size,
+                    (tile_x + 1) * tile_size,
+                    (tile_y + 1) * tile_size,
+                ),
+                lambda room_pos: self._render_room(options, room_pos),
+            )
+        else:
+            tile_image = Image.new(
+                mode="RGB",
+                size=(tile_size * 2, tile_size * 2),
+                color=renderer.ROOM_BORDER_COLOR,
+            )
+            for child_x, child_y in util.range2d(
+                tile_x * 2, tile_y * 2, tile_x * 2 + 2, tile_y * 2 + 2
+            ):
+                if self._has_tile(
+                    options, max_zoom, zoom + 1, child_x, child_y
+                ):
+                    tile_image.paste(
+                        self._render_tile(
+                            options, max_zoom, zoom + 1, child_x, child_y
+                        ),
+                        (
+                            (child_x - tile_x * 2) * tile_size,
+                            (child_y - tile_y * 2) * tile_size,
+                        ),
+                    )
+            tile_image = tile_image.resize(
+                (tile_size, tile_size), Image.ANTIALIAS
+            )
+
+        self.tiles.put(key, tile_image)
+        return tile_image
+
+    def _render_room(self, options: Options, room_pos: Coord) -> ImageObj:
+        key = (options, room_pos)
+        room_image = self.rooms.get(key)
+        if room_image is None:
+            room_image = self._get_room_renderer(options).render(room_pos)
+            self.rooms.put(key, room_image)
+        return room_image
+
+    def _get_result(self, key: T.Any, func: T.Callable[[], bytes]) -> bytes:
+        result = self.results.get(key)
+        if result is not None:
+            return result
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self._executor.submit(self._compute, key, func)
+                self._pending[key] = future
+        return future.result()
+
+    def _compute(self, key: T.Any, func: T.Callable[[], bytes]) -> bytes:
+        try:
+            with profiling.measure("serve"):
+                result = func()
+            self.results.put(key, result)
+            return result
+        finally:
+            with self._lock:
+                del self._pending[key]
+
+
+class _HTTPServer(socketserver.ThreadingMixIn, http_server.HTTPServer):
+    daemon_threads = True
+    map_server: MapServer
+
+
+class _RequestHandler(http_server.BaseHTTPRequestHandler):
+    server: _HTTPServer
+
+    def do_GET(self) -> None:
+        try:
+            content_type, body = self.server.map_server.handle(self.path)
+        except RequestError as ex:
+            self.send_error(ex.status, str(ex))
+            return
+        except Exception as ex:
+            self.send_error(500, str(ex))
+            raise
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(map_server: MapServer, host: str, port: int) -> None:
+    httpd = _HTTPServer((host, port), _RequestHandler)
+    httpd.map_server = map_server
+    print(
+        "Serving on http://%s:%d/" % httpd.server_address[:2], file=sys.stderr
+    )
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        map_server.close()
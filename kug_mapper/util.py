@@ -1,6 +1,9 @@
+import collections
 import os
 import re
 import string
+import sys
+import threading
 import typing as T
 
 from progress.bar import Bar
@@ -14,8 +17,10 @@ class Geometry:
         self.max_y = max_y
 
 
-def progress(what: T.Any) -> T.Any:
-    return Bar().iter(list(what))
+def progress(what: T.Any, count: T.Optional[int] = None) -> T.Any:
+    if count is None:
+        return Bar().iter(list(what))
+    return Bar(max=count).iter(what)
 
 
 def range2d(*args: int) -> T.Iterable[T.Tuple[int, int]]:
@@ -92,3 +97,187 @@ def memoize(f: T.Callable[..., T.Any]) -> T.Any:
         return results[args]
 
     return helper
+
+
+def get_value_size(value: T.Any) -> int:
+    if isinstance(value, (tuple, list)):
+        return sum(get_value_size(item) for item in value)
+    if hasattr(value, "getbands"):
+        return value.width * value.height * len(value.getbands())
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    def __init__(
+        self,
+        max_entries: T.Optional[int] = None,
+        max_bytes: T.Optional[int] = None,
+        get_size: T.Callable[[T.Any], int] = get_value_size,
+    ) -> None:
+        assert max_entries is None or max_entries > 0
+        assert max_bytes is None or max_bytes > 0
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._get_size = get_size
+        self._entries: T.Dict[T.Any, T.Tuple[T.Any, int]] = (
+            collections.OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> T.Dict[str, T.Any]:
+        return {
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "get_size": self._get_size,
+        }
+
+    def __setstate__(self, state: T.Dict[str, T.Any]) -> None:
+        self.__init__(  # type: ignore
+            state["max_entries"], state["max_bytes"], state["get_size"]
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: T.Any) -> bool:
+        return key in self._entries
+
+    def get(self, key: T.Any, default: T.Any = None) -> T.Any:
+        with self._lock:
+            try:
+                value, _size = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: T.Any, value: T.Any) -> None:
+        size = self._get_size(value)
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries[key][1]
+            self._entries[key] = (value, size)
+            self._entries.move_to_end(key)
+            self.total_bytes += size
+            self._evict()
+
+    def resize(
+        self, max_entries: T.Optional[int], max_bytes: T.Optional[int]
+    ) -> None:
+        assert max_entries is None or max_entries > 0
+        assert max_bytes is None or max_bytes > 0
+        with self._lock:
+            self.max_entries = max_entries
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self) -> None:
+        while len(self._entries) > 1 and (
+            (self.max_entries and len(self._entries) > self.max_entries)
+            or (self.max_bytes and self.total_bytes > self.max_bytes)
+        ):
+            _key, (_value, size) = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+
+DEFAULT_CACHE_MAX_BYTES = 256 << 20
+
+_caches: T.Dict[str, LRUCache] = {}
+_cache_budget: T.Dict[str, T.Optional[int]] = {}
+_foreign_cache_stats: T.Dict[T.Any, T.Dict[str, T.Dict[str, int]]] = {}
+
+
+def register_cache(name: str, cache: LRUCache) -> LRUCache:
+    _caches[name] = cache
+    if _cache_budget:
+        cache.resize(
+            _cache_budget.get("max_entries", cache.max_entries),
+            _cache_budget.get("max_bytes", cache.max_bytes),
+        )
+    return cache
+
+
+def configure_caches(
+    max_entries: T.Optional[int] = None, max_bytes: T.Optional[int] = None
+) -> None:
+    if max_entries is not None:
+        _cache_budget["max_entries"] = max_entries
+    if max_bytes is not None:
+        _cache_budget["max_bytes"] = max_bytes
+    for cache in _caches.values():
+        cache.resize(
+            _cache_budget.get("max_entries", cache.max_entries),
+            _cache_budget.get("max_bytes", cache.max_bytes),
+        )
+
+
+def clear_caches() -> None:
+    for cache in _caches.values():
+        cache.clear()
+
+
+def get_cache_budget() -> T.Dict[str, T.Optional[int]]:
+    return dict(_cache_budget)
+
+
+def get_local_cache_stats() -> T.Dict[str, T.Dict[str, int]]:
+    return {
+        name: {
+            "hits": cache.hits,
+            "misses": cache.misses,
+            "evictions": cache.evictions,
+            "entries": len(cache),
+            "bytes": cache.total_bytes,
+        }
+        for name, cache in _caches.items()
+    }
+
+
+def record_cache_stats(
+    source: T.Any, stats: T.Dict[str, T.Dict[str, int]]
+) -> None:
+    _foreign_cache_stats[source] = stats
+
+
+def get_cache_stats() -> T.Dict[str, T.Dict[str, int]]:
+    ret: T.Dict[str, T.Dict[str, int]] = {}
+    for stats in [get_local_cache_stats(), *_foreign_cache_stats.values()]:
+        for name, cache_stats in stats.items():
+            total = ret.setdefault(name, dict.fromkeys(cache_stats, 0))
+            for key, value in cache_stats.items():
+                total[key] += value
+    return dict(sorted(ret.items()))
+
+
+def lru_memoize(
+    name: str,
+    max_entries: T.Optional[int] = None,
+    max_bytes: T.Optional[int] = DEFAULT_CACHE_MAX_BYTES,
+) -> T.Callable[..., T.Any]:
+    missing = object()
+
+    def decorator(f: T.Callable[..., T.Any]) -> T.Any:
+        cache = register_cache(name, LRUCache(max_entries, max_bytes))
+
+        def helper(*args: T.Any) -> T.Any:
+            result = cache.get(args, missing)
+            if result is missing:
+                result = f(*args)
+                cache.put(args, result)
+            return result
+
+        return helper
+
+    return decorator